@@ -0,0 +1,367 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# google.genai is imported on first use (GeminiModel.client): it is the single
+# slowest import in the app and only matters when the AI toggle is on.
+
+# 1. VERDICT CACHE (Memory LRU + SQLite, both with a TTL)
+# Gemini calls cost money, so answers are shared between similar users:
+# inputs are rounded to bands before they become a cache key.
+SALARY_BAND = 5000
+SPEND_BAND = 1000
+SAVINGS_BAND = 1000
+
+def bucket(value, band):
+    """Rounds a number to the nearest band (e.g. 52,300 -> 50,000 for band 5000)."""
+    return int(round(float(value) / band) * band)
+
+def verdict_key(salary, spends, card_name, savings):
+    """Cache key shared by every profile that lands in the same bands."""
+    return f"{card_name}|{bucket(salary, SALARY_BAND)}|{bucket(spends, SPEND_BAND)}|{bucket(savings, SAVINGS_BAND)}"
+
+class VerdictCache:
+    """
+    Two-level cache for AI verdicts.
+    - Memory: LRU of max_entries.
+    - Disk: SQLite file that survives restarts (capped at max_disk_entries).
+    Entries older than ttl seconds are ignored and cleaned up.
+    """
+
+    def __init__(self, path=".verdict_cache.sqlite", max_entries=512, max_disk_entries=20000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()   # key -> (created, text)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+        if self.path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, text TEXT, created REAL)")
+
+    def _connect(self):
+        # Use as `with closing(self._connect()) as conn, conn:` - the connection's own
+        # context manager only commits/rolls back, it never closes the file handle
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _fresh(self, created):
+        return time.time() - created < self.ttl
+
+    def get(self, key):
+        """Returns the cached text or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        if self.path:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT text, created FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._fresh(row[1]):
+                self._remember(key, row[1], row[0])
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return row[0]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, text):
+        created = time.time()
+        self._remember(key, created, text)
+        if self.path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO verdicts (key, text, created) VALUES (?, ?, ?)", (key, text, created))
+                conn.execute("DELETE FROM verdicts WHERE created < ?", (created - self.ttl,))
+                conn.execute(
+                    "DELETE FROM verdicts WHERE key NOT IN (SELECT key FROM verdicts ORDER BY created DESC LIMIT ?)",
+                    (self.max_disk_entries,),
+                )
+
+    def _remember(self, key, created, text):
+        with self._lock:
+            self._memory[key] = (created, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["disk_hits"]) / total if total else 0.0
+
+# 2. MODEL CLIENTS (Anything with .stream(prompt) -> text chunks)
+class GeminiModel:
+    """Streams a response from Gemini. The genai.Client (and its HTTP pool) is built once."""
+
+    def __init__(self, api_key, model="gemini-2.5-flash-lite"):
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google import genai
+                    self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def stream(self, prompt):
+        for chunk in self.client.models.generate_content_stream(model=self.model, contents=prompt):
+            if chunk.text:
+                yield chunk.text
+
+class FakeModel:
+    """Offline stand-in that injects latency (first_token_delay, then per-word delay)."""
+
+    def __init__(self, text="This card pays you to shop. Swipe it!", first_token_delay=0.5, chunk_delay=0.05, error=None):
+        self.text = text
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.error = error
+
+    def stream(self, prompt):
+        time.sleep(self.first_token_delay)
+        if self.error:
+            raise self.error
+        for i, word in enumerate(self.text.split(" ")):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield word if i == 0 else " " + word
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the breaker is open."""
+
+class ManagedModel:
+    """
+    Wraps any model with:
+    - a concurrency limit (callers wait up to acquire_timeout for a slot),
+    - a circuit breaker: after failure_threshold failures in a row, calls are
+      skipped for cooldown seconds, then exactly one trial call is let through
+      (success closes the circuit, failure re-opens it for another cooldown),
+    - per-call latency stats (last 500 calls).
+    """
+
+    def __init__(self, model, max_concurrency=4, acquire_timeout=2.0, failure_threshold=3, cooldown=30.0):
+        self.model = model
+        self.acquire_timeout = acquire_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._latencies = deque(maxlen=500)
+        self.stats = {"calls": 0, "failures": 0, "short_circuited": 0, "busy": 0}
+
+    @property
+    def circuit_open(self):
+        """True while calls are being skipped (cooling down, or a trial call is running)."""
+        with self._lock:
+            return self._opened_at is not None and (
+                self._trial_running or time.monotonic() - self._opened_at < self.cooldown)
+
+    def _admit(self):
+        """Under self._lock: (admitted, is_trial). Once cooled down, exactly one caller is the trial."""
+        if self._opened_at is None:
+            return True, False
+        if self._trial_running or time.monotonic() - self._opened_at < self.cooldown:
+            return False, False
+        # Half-open: this caller is the trial, everyone else stays short-circuited
+        self._trial_running = True
+        return True, True
+
+    def stream(self, prompt):
+        with self._lock:
+            admitted, trial = self._admit()
+            if not admitted:
+                self.stats["short_circuited"] += 1
+        if not admitted:
+            metrics.count("ai_short_circuited")
+            raise CircuitOpenError("AI advisor temporarily disabled after repeated failures")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.stats["busy"] += 1
+                if trial:
+                    self._trial_running = False # Never reached the model: the next caller may try
+            raise CircuitOpenError("AI advisor is at its concurrency limit")
+
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                self.stats["calls"] += 1
+            metrics.count("ai_call")
+            yield from self.model.stream(prompt)
+            self._record(success=True, seconds=time.perf_counter() - start, trial=trial)
+        except Exception:
+            self._record(success=False, seconds=time.perf_counter() - start, trial=trial)
+            raise
+        finally:
+            if trial:
+                # Also covers a reader that abandons the stream midway (no verdict either way)
+                with self._lock:
+                    self._trial_running = False
+            self._slots.release()
+
+    def _record(self, success, seconds, trial=False):
+        with self._lock:
+            self._latencies.append(seconds)
+            if trial:
+                self._trial_running = False
+            if success:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self.stats["failures"] += 1
+            metrics.count("ai_call_error")
+            self._consecutive_failures += 1
+            if trial or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def latency_stats(self):
+        """p50 / p99 / mean call latency in seconds."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return {"count": 0, "p50": None, "p99": None, "mean": None}
+        pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+        return {"count": len(samples), "p50": pick(0.50), "p99": pick(0.99), "mean": sum(samples) / len(samples)}
+
+# 3. BACKGROUND JOBS (Never block the Streamlit script thread)
+AI_DEADLINE_SECONDS = 8.0
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-verdict")
+
+class VerdictJob:
+    """
+    One verdict being generated on the worker pool.
+    The script thread reads partial text with stream() and stops at a deadline;
+    the worker keeps going and caches the final answer for the next rerun.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    @classmethod
+    def completed(cls, text):
+        job = cls()
+        job._chunks.append(text)
+        job._done = True
+        return job
+
+    @classmethod
+    def submit(cls, model, prompt, on_done=None):
+        job = cls()
+        _EXECUTOR.submit(job._run, model, prompt, on_done)
+        return job
+
+    def _run(self, model, prompt, on_done):
+        try:
+            for chunk in model.stream(prompt):
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+            # Cache before marking done, so nobody sees "done" without a cached answer
+            if on_done and self.text:
+                on_done(self.text)
+        except Exception as e:
+            self.error = e
+            print(f"AI Error: {e}")
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def stream(self, timeout=AI_DEADLINE_SECONDS):
+        """Yields the growing text each time a chunk arrives, until done or the deadline."""
+        deadline = time.monotonic() + timeout
+        seen = 0
+        while True:
+            with self._cond:
+                while len(self._chunks) == seen and not self._done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    self._cond.wait(remaining)
+                seen = len(self._chunks)
+                text, done = "".join(self._chunks), self._done
+            if text:
+                yield text
+            if done:
+                return
+
+    def result(self, timeout=AI_DEADLINE_SECONDS):
+        """Blocks up to timeout; returns the full text, or None if not finished / failed."""
+        for _ in self.stream(timeout):
+            pass
+        if self._done and self.error is None:
+            return self.text or None
+        return None
+
+# 4. REQUEST COALESCING (Single-flight)
+# When a card goes "Hot", many sessions ask about the same card at once.
+# Requests with the same bucketed key share the one call already in flight.
+class SingleFlight:
+    """Maps key -> in-flight VerdictJob; finished jobs are dropped on the next lookup."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.stats = {"started": 0, "coalesced": 0, "finished_meanwhile": 0}
+
+    def run(self, key, start_job, find_done=None):
+        """
+        Returns the in-flight job for key, or calls start_job() to start one.
+        find_done() (e.g. a cache lookup) is re-checked under the lock first: a job
+        that finished after the caller's own cache miss has already left the table.
+        """
+        with self._lock:
+            for done_key in [k for k, job in self._jobs.items() if job.done]:
+                del self._jobs[done_key]
+
+            job = self._jobs.get(key)
+            if job is not None:
+                self.stats["coalesced"] += 1
+                metrics.count("ai_call_coalesced")
+                return job
+
+            job = find_done() if find_done is not None else None
+            if job is not None:
+                self.stats["finished_meanwhile"] += 1
+                return job
+
+            job = start_job()
+            self._jobs[key] = job
+            self.stats["started"] += 1
+            return job
+
+    def in_flight(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done)
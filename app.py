@@ -1,5 +1,7 @@
 import time
 
+import numpy as np
+import pandas as pd
 import streamlit as st
 print("1. App Started") # <--- Add this
 
@@ -12,6 +14,8 @@ print("3. Logic Imported") # <--- Add this
 import data_manager
 print("4. Data Manager Imported") # <--- Add this
 
+import metrics
+
 # --- 1. MEMORY INITIALIZATION (New) ---
 def init_session_state():
     # Salary Default
@@ -48,132 +52,172 @@ def main():
     # Initialize Memory
     init_session_state()
 
+    # Per-stage timings for this rerun (see metrics.py)
+    metrics.start_run()
+
     st.title("Trust & Transparency Unlocked") # <--- Visual check on screen
 
     # 2. LOAD CSS (From UI module)
-    ui.render_custom_css()
+    with metrics.stage("css"):
+        ui.render_custom_css()
 
     # 3. RENDER HEADER (Your missing piece!)
-    ui.render_header()
+    with metrics.stage("header"):
+        ui.render_header()
 
     # 4. LOAD DATA (From Data module)
-    df = data_manager.load_card_data()
+    with metrics.stage("load_card_data"):
+        catalogue = data_manager.get_card_catalogue()
+    df = catalogue.df
 
     #Get all card names from dropdown
     all_card_names = df["Card Name"].unique().tolist()
 
     # 5. RENDER SIDEBAR (And capture inputs)
     # We call the function, and it returns the user's choices
-    user_inputs = ui.render_sidebar(all_card_names)
+    with metrics.stage("sidebar"):
+        user_inputs = ui.render_sidebar(all_card_names)
 
     # 6. MAIN LOGIC FLOW
     
         
-    # A. Filter Cards based on Salary
-    # (Simple pandas filtering can stay here or move to logic.py)
-    valid_cards = df[df['Min Income'] <= user_inputs['salary']].copy()
-    
-    # B. Lounge Filter
-    if user_inputs['wants_lounge']:
-        valid_cards = valid_cards[valid_cards['Lounge Access'] == 'Yes']
-
-    # C. Calculate Rewards for every card (Using Logic Module)
-    # We apply the pure math function to every row
-    valid_cards['Net Savings'] = valid_cards.apply(
-        lambda row: logic.calculate_card_yield(row, user_inputs['spends']), 
-        axis=1
-    )
-    
-    # D. Sort Winners
-    valid_cards = valid_cards.sort_values(by='Net Savings', ascending=False)
+    # A-D. Filter, score and rank (Using Logic Module)
+    # Eligibility comes from the prebuilt index, scoring is one vectorized pass and
+    # only the top 5 are ranked. Identical inputs across sessions share one result;
+    # on a miss, only the spend categories that changed since last rerun are re-scored.
+    with metrics.stage("ranking"):
+        ranking = logic.get_result_cache().get_or_compute(
+            catalogue, user_inputs['salary'], user_inputs['spends'], user_inputs['wants_lounge'],
+            session_state=st.session_state
+        )
+    eligible, scores, top = ranking["eligible"], ranking["scores"], ranking["top"]
+    top_cards = logic.scored_rows(df, eligible[top], scores[top])
+
+    def full_table():
+        order = logic.full_ranking(catalogue, ranking)
+        be_all = logic.break_even_table(catalogue, ranking, user_inputs['spends'])
+        return logic.scored_rows(df, eligible[order], scores[order]).assign(**{
+            'Break-Even Spend': be_all["break_even_spend"][order],
+            'Fee Recovered': be_all["pct_recovered"][order],
+        })
+
+    def break_even_curves():
+        # Net Savings of the top cards as the whole spend profile scales 0.5x - 3x
+        sweep = logic.break_even_sweep(catalogue.card_arrays, eligible[top], user_inputs['spends'])
+        names = df["Card Name"].to_numpy()[eligible[top]]
+        return pd.DataFrame({
+            'Card Name': np.tile(names, len(sweep["multipliers"])),
+            'Monthly Spend': np.repeat(sweep["monthly_spend"], len(names)),
+            'Net Savings': sweep["net_savings"].ravel(),
+        })
+
+    def portfolios(triples):
+        # Same combos, with card names instead of catalogue positions
+        found = logic.portfolio_ranking(catalogue, ranking, user_inputs['spends'], triples=triples)
+        names = df["Card Name"].to_numpy()
+        named = lambda c: {**c, "cards": [names[p] for p in c["positions"]], "routing": {cat: names[p] for cat, p in c["routing"].items()}}
+        return {
+            "single": {**found["single"], "card": names[found["single"]["position"]]},
+            "pairs": [named(c) for c in found["pairs"]],
+            "triples": [named(c) for c in found["triples"]],
+            "stats": found["stats"],
+        }
     
     # E. Display Results (If cards exist)
-    if not valid_cards.empty:
-        best_card = valid_cards.iloc[0]
+    if not top_cards.empty:
+        best_card = top_cards.iloc[0]
 
-        ##new comparison logic 
-        comparison_result = None
-        current_card_name = user_inputs.get("current_card_name")
+        with metrics.stage("comparison"):
+            ##new comparison logic 
+            comparison_result = None
+            current_card_name = user_inputs.get("current_card_name")
 
-        # Check if user actually selected a card (and not "None")
-        if current_card_name and current_card_name != "I don't have a card":
+            # Check if user actually selected a card (and not "None")
+            if current_card_name and current_card_name != "I don't have a card":
 
-            # Find the row for the current card in the ORIGINAL dataframe (df)
-            # We use df (not valid_cards) because current card might be "invalid" for new salary
-            current_card_row = df[df['Card Name'] == current_card_name]
-            if not current_card_row.empty:
-                current_card_row = current_card_row.iloc[0]
+                # Find the row for the current card in the ORIGINAL dataframe (df)
+                # We use df (not just the eligible cards) because current card might be "invalid" for new salary
+                current_card_row = df[df['Card Name'] == current_card_name]
+                if not current_card_row.empty:
+                    current_card_row = current_card_row.iloc[0]
 
                 
-                # Calculate Net Savings for current card
-                current_card_net_savings = logic.calculate_card_yield(current_card_row, user_inputs['spends'])
+                    # Calculate Net Savings for current card
+                    current_card_net_savings = logic.calculate_card_yield(current_card_row, user_inputs['spends'])
 
-                #calculate the diff
-                diff = best_card["Net Savings"] - current_card_net_savings
+                    #calculate the diff
+                    diff = best_card["Net Savings"] - current_card_net_savings
 
                 
-                # Prepare comparison data
-                # Ignore small differences (noise)
-                if abs(diff) > 100: 
-                    comparison_result = {
-                        "current_card_name": current_card_name,
-                        "diff": int(diff)
-                    }
-
-
-        # Calculate Break-Even Stats (Using Logic Module)
-        be_stats = logic.calculate_break_even_stats(
-            fee=best_card['Fee'], 
-            net_savings=best_card['Net Savings'], 
-            user_total_annual_spend=user_inputs['spends']['total']
-        )
+                    # Prepare comparison data
+                    # Ignore small differences (noise)
+                    if abs(diff) > 100: 
+                        comparison_result = {
+                            "current_card_name": current_card_name,
+                            "diff": int(diff)
+                        }
+
+
+        # Break-Even Stats (computed with the ranking, using Logic Module)
+        be_stats = ranking["break_even"]
         
         # Get AI Verdict (Using Logic Module - Feature Flag Checked)
-        ai_text = None
+        # Runs in the background so the rest of the page paints straight away
+        ai_job = None
         
         if user_inputs["enable_ai"] and user_inputs["ask_ai_clicked"]:
-            with st.spinner("🤖 Asking Gemini..."):
-                ai_text = logic.get_ai_verdict(
+            with metrics.stage("ai_verdict_start"):
+                ai_job = logic.start_ai_verdict(
                     salary=user_inputs['salary'],
                     spends=user_inputs['spends']['total'],
                     card_name=best_card['Card Name'],
                     savings=best_card['Net Savings']
                 )
 
-        # 1. Calculate the Verdict (NEW)
-        verdict = logic.get_credlens_verdict(
-            net_savings=best_card['Net Savings'],
-            fee=best_card['Fee']
-        )
+        # 1. The Verdict (NEW, also part of the cached ranking)
+        verdict = ranking["verdict"]
 
         # RENDER THE RESULTS (Using UI Module)
-        ui.render_results(
-            best_card=best_card, 
-            break_even_stats=be_stats, 
-            ai_verdict=ai_text, 
-            valid_cards_df=valid_cards,
-            spends = user_inputs["spends"],
-            verdict = verdict,
-            comparison_data = comparison_result
-        )
+        with metrics.stage("render_results"):
+            ai_slot = ui.render_results(
+                best_card=best_card, 
+                break_even_stats=be_stats, 
+                ai_verdict=ai_job.text if ai_job and ai_job.done else None, 
+                valid_cards_df=top_cards,
+                full_table_fn=full_table,
+                portfolio_fn=portfolios,
+                sweep_fn=break_even_curves,
+                spends = user_inputs["spends"],
+                verdict = verdict,
+                comparison_data = comparison_result,
+                ai_pending = ai_job is not None and not ai_job.done
+            )
         
         # Save Lead (Using Data Module)
         current_time = time.time()
         if current_time - st.session_state["last_save_time"]> 10:
 
-            data_manager.save_lead_to_sheets(
-                salary=user_inputs['salary'],
-                spends=user_inputs['spends'],
-                top_card=best_card['Card Name'],
-                savings=int(best_card['Net Savings'])
-            )
+            with metrics.stage("save_lead"):
+                data_manager.save_lead_to_sheets(
+                    salary=user_inputs['salary'],
+                    spends=user_inputs['spends'],
+                    top_card=best_card['Card Name'],
+                    savings=int(best_card['Net Savings'])
+                )
 
             #update the timer
             st.session_state["last_save_time"] = current_time
+
+        # Fill in the advisor text as it streams (page is already on screen)
+        if ai_slot is not None:
+            with metrics.stage("ai_verdict_stream"):
+                ui.render_ai_stream(ai_slot, ai_job)
         
     else:
         st.error("😕 No cards found for your salary profile.")
 
+    metrics.end_run()
+
     # else:
     #     # Initial State
     #     st.info("👈 Enter your details in the sidebar to find your perfect card.")
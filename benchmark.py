@@ -0,0 +1,360 @@
+"""
+CredLens benchmark suite.
+
+Times the hot paths on synthetic catalogues (20 / 1k / 10k / 100k cards) and
+synthetic profile batches, reports throughput, p50/p99 latency and peak memory,
+and compares against a baseline recorded on the same machine.
+
+    python benchmark.py                      # run everything, compare to this machine's baseline
+    python benchmark.py --sizes 20 1000      # smaller run
+    python benchmark.py --save-baseline      # re-record this machine's baseline
+    python benchmark.py --against main       # time a git revision in the same run and compare to it
+
+Timings only mean something on the machine that produced them, so baselines
+are not committed: the first run on a machine records bench_baseline.json,
+and a baseline recorded on different hardware is ignored (re-record it).
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import data_manager
+import logic
+
+BASELINE_PATH = "bench_baseline.json"
+DEFAULT_SIZES = (20, 1000, 10000, 100000)
+REGRESSION_TOLERANCE = 0.25 # p50 may be 25% slower than baseline before we flag it
+REGRESSION_MIN_MS = 0.05     # ...and at least this much slower (sub-50 µs cases are timer noise)
+DEFAULT_SPENDS = {"online": 5000, "travel": 0, "offline": 2000, "utilities": 2000, "upi": 1000, "total": 10000}
+
+# 1. SYNTHETIC DATA
+def synthetic_catalogue(n, seed=0, source="cards.csv"):
+    """n cards built from the real catalogue rows with jittered rates, fees and caps."""
+    rng = np.random.default_rng(seed)
+    base = data_manager.prepare_card_data(pd.read_csv(source))
+    df = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    df["Card Name"] = [f"{name} #{i}" for i, name in enumerate(df["Card Name"])]
+    for col in logic.RATE_COLUMNS:
+        df[col] = np.round(df[col] * rng.uniform(0.5, 1.5, n), 2)
+    df["Fee"] = (df["Fee"] * rng.uniform(0.5, 1.5, n)).round().astype(int)
+    df["Monthly Cap"] = (df["Monthly Cap"] * rng.uniform(0.5, 2.0, n)).round()
+    df["Min Income"] = rng.choice([0, 15000, 25000, 35000, 50000, 75000, 100000, 200000], n)
+    return df
+
+def synthetic_profiles(n, seed=1):
+    """n (salary, spends) profiles with roughly realistic spreads."""
+    rng = np.random.default_rng(seed)
+    spends = rng.gamma(2.0, 2500.0, (n, len(logic.SPEND_CATEGORIES))).round()
+    salaries = rng.choice([25000, 40000, 50000, 75000, 100000, 150000, 300000], n)
+    return spends, salaries
+
+# 2. MEASUREMENT
+def measure(fn, repeat, warmup=1, items=1):
+    """Runs fn repeat times; returns latency percentiles, throughput and peak memory."""
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples)
+    return {
+        "p50_ms": float(np.percentile(samples, 50) * 1000),
+        "p99_ms": float(np.percentile(samples, 99) * 1000),
+        "items_per_s": float(items / samples.mean()) if samples.mean() > 0 else float("inf"),
+        "peak_mb": peak / 1e6,
+        "runs": repeat,
+    }
+
+def repeats_for(n, budget):
+    """Fewer repeats for big catalogues so one case stays within a few seconds."""
+    return max(3, min(budget, int(budget * 1000 / max(n, 1))))
+
+# 3. CASES
+def bench_catalogue(n, repeat, workdir):
+    results = {}
+    df = synthetic_catalogue(n)
+    csv_path = os.path.join(workdir, f"cards_{n}.csv")
+    df.to_csv(csv_path, index=False)
+    cache_dir = os.path.join(workdir, f"cache_{n}")
+
+    # Loading: raw CSV parse (what load_card_data used to do) vs compiled catalogue
+    results["load_csv_parse"] = measure(lambda: data_manager.prepare_card_data(pd.read_csv(csv_path)), repeats_for(n, 20))
+    data_manager.compile_card_catalogue(csv_path, cache_dir)
+    results["load_compiled"] = measure(lambda: data_manager.load_compiled_catalogue(csv_path, cache_dir), repeats_for(n, 20))
+    store = data_manager.CatalogueStore(csv_path, cache_dir)
+    results["load_store_warm"] = measure(store.get, repeat)
+
+    catalogue = store.get()
+    df = catalogue.df
+    salary, spends = 50000, DEFAULT_SPENDS
+
+    # Filter + score: legacy row-wise apply vs vectorized vs index + vectorized
+    def legacy_filter_apply():
+        valid = df[df["Min Income"] <= salary].copy()
+        valid["Net Savings"] = valid.apply(lambda row: logic.calculate_card_yield(row, spends), axis=1)
+        return valid
+    results["filter_apply_rowwise"] = measure(legacy_filter_apply, repeats_for(n, 5), warmup=0, items=n)
+
+    def vectorized():
+        eligible = catalogue.eligibility.candidates(salary)
+        return logic.score_card_arrays(logic.subset_card_arrays(catalogue.card_arrays, eligible), spends)
+    results["filter_score_vectorized"] = measure(vectorized, repeat, items=n)
+
+    scored = legacy_filter_apply()
+    results["sort_full"] = measure(lambda: scored.sort_values(by="Net Savings", ascending=False), repeat, items=n)
+    scores = vectorized()
+    eligible = catalogue.eligibility.candidates(salary)
+    results["top5_partial"] = measure(lambda: logic.rank_scored(catalogue.card_arrays, eligible, scores, k=5), repeat, items=n)
+
+    results["rank_profile_uncached"] = measure(lambda: logic.rank_profile(catalogue, salary, spends), repeat, items=n)
+    cache = logic.ResultCache()
+    results["rank_profile_cached"] = measure(lambda: cache.get_or_compute(catalogue, salary, spends), repeat, items=n)
+
+    # Two-card combos over every eligible card (pruned pairwise search)
+    results["portfolio_pairs"] = measure(lambda: logic.best_portfolios(catalogue.card_arrays, eligible, spends), repeats_for(n, 10), items=len(eligible))
+
+    # Break-even for every eligible card (scalar function in a loop)
+    fees, totals = scored["Fee"].to_numpy(), scored["Net Savings"].to_numpy()
+    def break_even_all():
+        return [logic.calculate_break_even_stats(f, s, spends["total"]) for f, s in zip(fees, totals)]
+    results["break_even_scalar_loop"] = measure(break_even_all, repeats_for(n, 10), items=len(fees))
+    results["break_even_vectorized"] = measure(lambda: logic.break_even_arrays(fees, totals, spends["total"]), repeat, items=len(fees))
+
+    # Formatting the Detailed Comparison column
+    # format_inr is lru_cached: time the undecorated function, or every repeat after the first is all cache hits
+    results["format_inr_column"] = measure(lambda: scored["Net Savings"].apply(logic.format_inr.__wrapped__), repeats_for(n, 10), items=len(scored))
+    results["format_inr_vectorized"] = measure(lambda: logic.format_inr_array(scored["Net Savings"]), repeat, items=len(scored))
+    return results
+
+def bench_profiles(n_profiles, n_cards, repeat):
+    catalogue = logic.build_card_arrays(synthetic_catalogue(n_cards))
+    spends, salaries = synthetic_profiles(n_profiles)
+    return {
+        f"best_card_per_profile_{n_profiles}x{n_cards}": measure(
+            lambda: logic.best_card_per_profile(catalogue, spends, salaries), max(3, repeat // 10), items=n_profiles
+        )
+    }
+
+RENDER_SCRIPT = """
+import os, sys
+sys.path.insert(0, {root!r}); os.chdir({root!r})
+import streamlit as st
+import data_manager, logic, ui
+catalogue = data_manager.CatalogueStore({csv!r}, {cache!r}).get()
+spends = {spends!r}
+ranking = logic.rank_profile(catalogue, 50000, spends)
+eligible, scores, top = ranking["eligible"], ranking["scores"], ranking["top"]
+top_cards = logic.scored_rows(catalogue.df, eligible[top], scores[top])
+ui.render_custom_css()
+ui.render_results(
+    best_card=top_cards.iloc[0], break_even_stats=ranking["break_even"], ai_verdict=None,
+    valid_cards_df=top_cards, spends=spends, verdict=ranking["verdict"],
+    full_table_fn=lambda: logic.scored_rows(catalogue.df, eligible, scores),
+)
+"""
+
+def bench_render(n, repeat, workdir):
+    """Headless render_results through Streamlit's AppTest (expander opened = full table)."""
+    from streamlit.testing.v1 import AppTest
+
+    csv_path = os.path.join(workdir, f"cards_{n}.csv")
+    if not os.path.exists(csv_path):
+        synthetic_catalogue(n).to_csv(csv_path, index=False)
+    script = RENDER_SCRIPT.format(root=os.path.abspath("."), csv=csv_path, cache=os.path.join(workdir, f"cache_{n}"), spends=DEFAULT_SPENDS)
+
+    def render(open_table):
+        at = AppTest.from_string(script, default_timeout=120)
+        if open_table:
+            at.session_state["detailed_comparison"] = True
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return {
+        "render_results": measure(lambda: render(False), max(3, repeat // 20)),
+        "render_results_with_table": measure(lambda: render(True), max(3, repeat // 20)),
+    }
+
+# Cold start: how long a fresh worker takes to import the app
+IMPORT_BUDGET_MS = 1000
+LAZY_MODULES = ("altair", "gspread", "google.genai") # must NOT be imported by "import app"
+IMPORT_PROBE = "import sys, app; print('EAGER:' + ','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+
+def _import_app_once():
+    """Runs 'import app' in a fresh interpreter with -X importtime; returns (total_us, per-module us, eager heavy modules)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_PROBE],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, total_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        cumulative[name] = int(total_us)
+    probe = [line for line in proc.stdout.splitlines() if line.startswith("EAGER:")]
+    eager = [m for m in probe[-1][len("EAGER:"):].split(",") if m] if probe else []
+    return cumulative.get("app", 0), cumulative, eager
+
+def bench_imports(repeat=5):
+    """Import-time profile of app.py (like python -X importtime), checked against IMPORT_BUDGET_MS."""
+    samples, cumulative, eager = [], {}, []
+    for _ in range(repeat):
+        total_us, cumulative, eager = _import_app_once()
+        samples.append(total_us / 1000)
+    samples = np.array(samples)
+
+    top = sorted(((us, name) for name, us in cumulative.items() if "." not in name and name != "app"), reverse=True)[:8]
+    print("Slowest top-level imports (cumulative ms): " + ", ".join(f"{name} {us / 1000:.0f}" for us, name in top), file=sys.stderr)
+    if eager:
+        print(f"WARNING: lazy modules imported at startup: {', '.join(eager)}", file=sys.stderr)
+    if np.percentile(samples, 50) > IMPORT_BUDGET_MS:
+        print(f"WARNING: import app p50 {np.percentile(samples, 50):.0f} ms is over the {IMPORT_BUDGET_MS} ms budget", file=sys.stderr)
+
+    return {"import_app": {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "items_per_s": float(1000 / samples.mean()),
+        "peak_mb": 0.0,
+        "runs": repeat,
+    }}
+
+# 4. BASELINES
+def machine_signature():
+    """What has to match for two runs' timings to be comparable."""
+    return {
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+def load_baseline(path):
+    """This machine's baseline results ({} if missing or recorded elsewhere)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        stored = json.load(f)
+    if stored.get("machine") != machine_signature():
+        print(f"Ignoring {path}: it was recorded on a different machine (run with --save-baseline)", file=sys.stderr)
+        return {}
+    return stored.get("results", {})
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump({"machine": machine_signature(), "results": results}, f, indent=2, sort_keys=True)
+
+def run_revision(rev, argv):
+    """Runs this suite, with the same arguments, on a git revision checked out to a temp worktree."""
+    worktree = tempfile.mkdtemp(prefix="bench-")
+    try:
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, rev], check=True, capture_output=True)
+        out = os.path.join(worktree, "bench_results.json")
+        subprocess.run([sys.executable, "benchmark.py", *argv, "--json", out, "--baseline", os.path.join(worktree, "unused.json")],
+                       cwd=worktree, check=False, stdout=subprocess.DEVNULL)
+        if not os.path.exists(out):
+            raise SystemExit(f"{rev}: benchmark.py produced no results (does that revision have the suite?)")
+        with open(out) as f:
+            return json.load(f)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree], capture_output=True)
+        shutil.rmtree(worktree, ignore_errors=True)
+
+def compare(results, baseline):
+    """Returns a list of (case, now_ms, baseline_ms) that got slower than the tolerance."""
+    regressions = []
+    for case, stats in results.items():
+        old = baseline.get(case)
+        if old and stats["p50_ms"] > max(old["p50_ms"] * (1 + REGRESSION_TOLERANCE), old["p50_ms"] + REGRESSION_MIN_MS):
+            regressions.append((case, stats["p50_ms"], old["p50_ms"]))
+    return regressions
+
+def print_table(results, baseline):
+    print(f"{'case':58} {'p50 ms':>10} {'p99 ms':>10} {'items/s':>12} {'peak MB':>9} {'vs base':>8}")
+    for case, s in results.items():
+        old = baseline.get(case)
+        delta = f"{s['p50_ms'] / old['p50_ms']:.2f}x" if old and old["p50_ms"] else "-"
+        print(f"{case:58} {s['p50_ms']:10.3f} {s['p99_ms']:10.3f} {s['items_per_s']:12.0f} {s['peak_mb']:9.2f} {delta:>8}")
+
+def _without(argv, valued, flags):
+    """argv minus the given options (valued ones also drop their value)."""
+    kept, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in valued:
+            skip = True
+        elif arg not in flags and not arg.startswith(tuple(f"{option}=" for option in valued)):
+            kept.append(arg)
+    return kept
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=50, help="repeats for fast cases (big catalogues use fewer)")
+    parser.add_argument("--profiles", type=int, default=100000, help="profile batch size (0 to skip)")
+    parser.add_argument("--no-render", action="store_true", help="skip the AppTest render cases")
+    parser.add_argument("--imports-only", action="store_true", help="only run the cold-start import profile")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="this machine's baseline (recorded on first run)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--against", metavar="REV", help="compare to a git revision run now on this machine instead")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.against:
+        # Time the other revision first, with the same sizes/repeats, on the same machine
+        passthrough = _without(sys.argv[1:] if argv is None else argv, ("--against", "--json", "--baseline"), ("--save-baseline",))
+        print(f"... timing {args.against}", file=sys.stderr)
+        baseline = run_revision(args.against, passthrough)
+    else:
+        baseline = load_baseline(args.baseline)
+
+    results = bench_imports()
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in ([] if args.imports_only else args.sizes):
+            print(f"... catalogue of {n} cards", file=sys.stderr)
+            results.update({f"{case}[{n}]": stats for case, stats in bench_catalogue(n, args.repeat, workdir).items()})
+            if not args.no_render and n <= 10000:
+                results.update({f"{case}[{n}]": stats for case, stats in bench_render(n, args.repeat, workdir).items()})
+        if args.profiles and not args.imports_only:
+            print(f"... {args.profiles} profiles", file=sys.stderr)
+            results.update(bench_profiles(args.profiles, 1000, args.repeat))
+
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline or (not args.against and not baseline):
+        # First run on this machine (or an explicit re-record): nothing to compare against yet
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline)
+    for case, now, old in regressions:
+        print(f"REGRESSION {case}: p50 {now:.3f} ms vs baseline {old:.3f} ms")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# Lets pytest import the app modules (logic, statement_parser, ...) from the repo root.
@@ -1,75 +1,428 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
-import gspread
-import streamlit as st
 from datetime import datetime
 
+import logic
+import metrics
+from resources import process_resource
+from image_cache import ImageCache
+from lead_writer import LeadWriter, SheetsSink
+
 # 1. LOAD DATA
-@st.cache_data(ttl=60) 
-def load_card_data(csv_path: str = "cards.csv") -> pd.DataFrame:
+# The CSV is "compiled" once into a folder of .npy column files (defaults and
+# test data already applied). Later loads memory-map that folder and only
+# re-parse the CSV when its content actually changes. Numeric columns stay
+# memory-mapped (read-only) inside the DataFrame; text columns are rebuilt as
+# Python strings on load, since pandas cannot use fixed-width unicode directly.
+CATALOGUE_DIR = ".catalogue_cache"
+# Part of every build's key: bump it whenever prepare_card_data or the column
+# file layout changes, so builds made by older code are never reused.
+CATALOGUE_SCHEMA_VERSION = 2
+PRUNE_GRACE_SECONDS = 3600 # builds used within this long are never deleted (other processes may still load them)
+
+def prepare_card_data(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Reads the raw CSV and applies safety defaults.
-    Returns a clean DataFrame ready for analysis.
+    Applies safety defaults and the temporary test-data overrides to a raw catalogue.
     """
-    try:
-        df = pd.read_csv(csv_path)
-        
-        # Standardize column names (remove accidental spaces)
-        df.columns = df.columns.str.strip()
-        
-        # Safety: Fill missing critical text fields to prevent crashes
-        defaults = {
-            'Pro_Reason': "Great cashback rates.",
-            'Con_Reason': "Check fee waiver limits.",
-            'Image_URL': None,
-            'Apply_Link': None,
-            'Status': "Stable", # Default status for Devaluation Tracker
-            'Warning_Text': None
-        }
-        
-        for col, default_val in defaults.items():
-            if col not in df.columns:
-                df[col] = default_val
-        
-        # --- TEST DATA INJECTION (Temporary) ---
-        # Let's pretend specific cards are Devalued/Hot to test UI
-        # In real life, you edit the CSV file directly.
+    # Standardize column names (remove accidental spaces)
+    df.columns = df.columns.str.strip()
+    
+    # Safety: Fill missing critical text fields to prevent crashes
+    defaults = {
+        'Pro_Reason': "Great cashback rates.",
+        'Con_Reason': "Check fee waiver limits.",
+        'Image_URL': None,
+        'Apply_Link': None,
+        'Status': "Stable", # Default status for Devaluation Tracker
+        'Warning_Text': None
+    }
+    
+    for col, default_val in defaults.items():
+        if col not in df.columns:
+            df[col] = default_val
+    
+    # --- TEST DATA INJECTION (Temporary) ---
+    # Let's pretend specific cards are Devalued/Hot to test UI
+    # In real life, you edit the CSV file directly.
+    
+    if 'Status' in df.columns:
+        # Force 'Axis Magnus' to be Devalued
+        df.loc[df['Card Name'].str.contains("Infinia", case=False), 'Status'] = "Devalued"
+        df.loc[df['Card Name'].str.contains("Infinia", case=False), 'Warning_Text'] = "Milestones removed. Fees increased to 12.5k."
         
-        if 'Status' in df.columns:
-            # Force 'Axis Magnus' to be Devalued
-            df.loc[df['Card Name'].str.contains("Infinia", case=False), 'Status'] = "Devalued"
-            df.loc[df['Card Name'].str.contains("Infinia", case=False), 'Warning_Text'] = "Milestones removed. Fees increased to 12.5k."
-            
-            # Force 'SBI Cashback' to be Hot
-            df.loc[df['Card Name'].str.contains("Neu", case=False), 'Status'] = "Hot"
-        # ---------------------------------------
+        # Force 'SBI Cashback' to be Hot
+        df.loc[df['Card Name'].str.contains("Neu", case=False), 'Status'] = "Hot"
+    # ---------------------------------------
+    return df
+
+def _file_fingerprint(path):
+    """Cheap identity check (mtime + size) used before hashing."""
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+def compile_card_catalogue(csv_path: str = "cards.csv", cache_dir: str = CATALOGUE_DIR) -> str:
+    """
+    Parses the CSV once and writes a typed, memory-mappable catalogue.
+    Each build lives in its own content-addressed folder, so readers in other
+    processes never see a half-written catalogue. Returns the build folder.
+    """
+    digest = _file_hash(csv_path)
+    build_dir = os.path.join(cache_dir, f"{digest[:16]}-v{CATALOGUE_SCHEMA_VERSION}")
+
+    if not os.path.exists(os.path.join(build_dir, "meta.json")):
+        df = prepare_card_data(pd.read_csv(csv_path))
+        tmp_dir = f"{build_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        columns = []
+        for i, col in enumerate(df.columns):
+            series = df[col]
+            if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                kind = "numeric"
+                np.save(os.path.join(tmp_dir, f"col_{i}.npy"), series.to_numpy())
+            else:
+                # Text: fixed-width unicode (mmap-friendly) plus a null mask
+                kind = "text"
+                missing = series.isna().to_numpy()
+                values = np.array(series.fillna("").astype(str).tolist(), dtype=str)
+                np.save(os.path.join(tmp_dir, f"col_{i}.npy"), values)
+                np.save(os.path.join(tmp_dir, f"null_{i}.npy"), missing)
+            columns.append({"name": col, "kind": kind, "dtype": str(series.dtype)})
+
+        _write_json_atomic(os.path.join(tmp_dir, "meta.json"), {"sha256": digest, "schema": CATALOGUE_SCHEMA_VERSION, "columns": columns})
+        try:
+            os.replace(tmp_dir, build_dir)
+        except OSError:
+            # Another worker finished the same build first; theirs is identical
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    _write_json_atomic(os.path.join(cache_dir, "latest.json"), {
+        "source": os.path.abspath(csv_path),
+        "sha256": digest,
+        "schema": CATALOGUE_SCHEMA_VERSION,
+        "build_dir": build_dir,
+        **_file_fingerprint(csv_path),
+    })
+    _prune_old_builds(cache_dir, keep=build_dir)
+    return build_dir
+
+def _prune_old_builds(cache_dir, keep, max_builds=3, grace=PRUNE_GRACE_SECONDS):
+    """
+    Deletes all but the newest few build folders. The active one, and any
+    loaded within the grace period (loads bump the folder's mtime), are kept.
+    """
+    builds = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+    builds = [b for b in builds if os.path.isdir(b) and not b.endswith(".tmp") and b != keep]
+    builds.sort(key=os.path.getmtime, reverse=True)
+    cutoff = time.time() - grace
+    for old_dir in builds[max_builds - 1:]:
+        try:
+            if os.path.getmtime(old_dir) > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+def _current_build_dir(csv_path, cache_dir):
+    """Returns an up-to-date build folder, recompiling only if the CSV content changed."""
+    pointer_path = os.path.join(cache_dir, "latest.json")
+    try:
+        with open(pointer_path) as f:
+            pointer = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return compile_card_catalogue(csv_path, cache_dir)
+
+    if (pointer.get("source") != os.path.abspath(csv_path) or pointer.get("schema") != CATALOGUE_SCHEMA_VERSION
+            or not os.path.isdir(pointer.get("build_dir", ""))):
+        return compile_card_catalogue(csv_path, cache_dir)
+
+    # Fast path: same mtime/size means same file
+    fingerprint = _file_fingerprint(csv_path)
+    if all(pointer.get(k) == v for k, v in fingerprint.items()):
+        return pointer["build_dir"]
+
+    # File was touched: only rebuild if the bytes are actually different
+    if _file_hash(csv_path) == pointer.get("sha256"):
+        _write_json_atomic(pointer_path, {**pointer, **fingerprint})
+        return pointer["build_dir"]
+    return compile_card_catalogue(csv_path, cache_dir)
+
+def load_compiled_catalogue(csv_path: str = "cards.csv", cache_dir: str = CATALOGUE_DIR) -> pd.DataFrame:
+    """
+    Loads the compiled catalogue for csv_path (building it on first use).
+    Raises FileNotFoundError if the CSV does not exist.
+    """
+    return _load_build(_current_build_dir(csv_path, cache_dir))[0]
+
+def _load_build(build_dir):
+    """(DataFrame, meta) for one compiled build folder."""
+    with open(os.path.join(build_dir, "meta.json")) as f:
+        meta = json.load(f)
+    try:
+        os.utime(build_dir) # Marks the build as in use for _prune_old_builds
+    except OSError:
+        pass
+
+    data = {}
+    for i, col in enumerate(meta["columns"]):
+        values = np.load(os.path.join(build_dir, f"col_{i}.npy"), mmap_mode="r")
+        if col["kind"] == "numeric":
+            data[col["name"]] = values
+        else:
+            missing = np.load(os.path.join(build_dir, f"null_{i}.npy"))
+            text = values.astype(object)
+            text[missing] = None
+            data[col["name"]] = pd.Series(text, dtype=col["dtype"])
+    # copy=False keeps the numeric columns backed by the mmaps
+    return pd.DataFrame(data, copy=False), meta
+
+# 1a. DERIVED DISPLAY COLUMNS (Computed once per catalogue version)
+# The results page used to work these out on every render. Brand keywords are
+# matched as case-insensitive substrings; when a name contains several, the one
+# listed first here wins (e.g. "Amazon Pay ICICI" is ICICI orange).
+BRAND_COLORS = {
+    # The Big Players
+    "SBI": "#1C4FA1",       # Navy Blue
+    "HDFC": "#004C8F",      # Dark Blue
+    "Axis": "#97144D",      # Burgundy (Axis Official)
+    "ICICI": "#F58220",     # Orange
+    "Amex": "#006FCF",      # Bright Blue
+    "American": "#006FCF",
+
+    # The New Specialists (Added)
+    "Airtel": "#E40000",    # Airtel Red
+    "Swiggy": "#FC8019",    # Swiggy Orange
+    "Tata": "#2B2E34",      # Tata Black/Grey
+    "Amazon": "#FF9900",    # Amazon Yellow/Orange
+    "HSBC": "#DB0011",      # HSBC Red
+    "Yes": "#00539C",       # Yes Bank Blue
+    "AU": "#682C91",        # AU Bank Purple
+    "IDFC": "#9C1D27",      # IDFC Red
+    "OneCard": "#1A1A1A",   # Metal Black
+    "Standard": "#007D3E",  # SC Green (Official is Green/Blue)
+}
+DEFAULT_BRAND_COLOR = "#555555" # Grey (Neutral) instead of Red (Danger)
+
+def compile_brand_matcher(brand_colors=BRAND_COLORS):
+    """
+    One regex for all brands. Alternatives are tried in dict order, each
+    scanning the whole name, so priority follows the dict (not the position in the name).
+    """
+    groups = [f".*?(?P<b{i}>{re.escape(brand)})" for i, brand in enumerate(brand_colors)]
+    return re.compile("(?:" + "|".join(groups) + ")", re.IGNORECASE | re.DOTALL)
+
+_BRAND_MATCHER = compile_brand_matcher()
+_BRAND_PALETTE = list(BRAND_COLORS.values())
+
+def brand_color(card_name, matcher=_BRAND_MATCHER, palette=_BRAND_PALETTE):
+    """Hex colour for a card name (DEFAULT_BRAND_COLOR if no brand matches)."""
+    match = matcher.match(str(card_name))
+    return palette[int(match.lastgroup[1:])] if match else DEFAULT_BRAND_COLOR
+
+def add_derived_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the columns the results page looks up instead of recomputing:
+    Brand Color, Status Class (CSS class of the status badge) and Search Slug
+    (card name for the reviews search URL).
+    """
+    if df.empty:
         return df
-        
+    names = df['Card Name'].astype(str)
+    status = df['Status'].fillna("Stable").astype(str) if 'Status' in df.columns else pd.Series("Stable", index=df.index)
+    return df.assign(**{
+        'Brand Color': names.map({name: brand_color(name) for name in names.unique()}),
+        'Status Class': ("status-" + status.str.lower()).where(status != "", "stable"),
+        'Search Slug': names.str.replace(' ', '+', regex=False),
+    })
+
+# 1b. CHANGE-DETECTING CACHE
+# Keeps the catalogue in memory for as long as cards.csv is unchanged.
+# A change is picked up by a cheap stat() check, then confirmed by hashing the
+# file on a background thread: only different bytes rebuild the catalogue and
+# bump the version (a touch or an identical re-save keeps every version-keyed
+# cache warm). The rebuild is swapped in as a whole new snapshot, so a rerun
+# either sees the old table or the new one, never a mix.
+class CatalogueSnapshot(NamedTuple):
+    version: int          # Bumps on every reload; downstream caches key on this
+    df: pd.DataFrame      # Shared between sessions: treat as read-only
+    fingerprint: tuple    # (mtime_ns, size) of the source when loaded
+    card_arrays: dict = None                         # logic.build_card_arrays(df)
+    eligibility: logic.EligibilityIndex = None       # Min Income / lounge index
+    sha256: str = None                               # Content hash of the source
+
+class CatalogueStore:
+    """Process-wide holder of the current catalogue snapshot."""
+
+    def __init__(self, csv_path: str = "cards.csv", cache_dir: str = CATALOGUE_DIR, check_interval: float = 1.0, on_build=()):
+        self.csv_path = csv_path
+        self.on_build = list(on_build) # Called with each new snapshot (e.g. image cache warm-up)
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._last_check = 0.0
+        self._snapshot = None
+
+    def _stat(self):
+        fp = _file_fingerprint(self.csv_path)
+        return (fp["mtime_ns"], fp["size"])
+
+    def _build(self, version):
+        fingerprint = self._stat()
+        # Everything derived from the table is built here, once per version
+        df, meta = _load_build(_current_build_dir(self.csv_path, self.cache_dir))
+        df = add_derived_columns(df)
+        card_arrays = logic.build_card_arrays(df)
+        snapshot = CatalogueSnapshot(version, df, fingerprint, card_arrays, logic.EligibilityIndex(card_arrays), meta["sha256"])
+        for hook in self.on_build:
+            try:
+                hook(snapshot)
+            except Exception as e:
+                print(f"Catalogue Hook Error: {e}")
+        return snapshot
+
+    def get(self) -> CatalogueSnapshot:
+        """Returns the current snapshot, scheduling a background reload if the file changed."""
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    # First load is synchronous: there is nothing to serve yet
+                    self._snapshot = self._build(version=1)
+            return self._snapshot
+
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self._maybe_reload()
+        return self._snapshot
+
+    def _maybe_reload(self):
+        try:
+            changed = self._stat() != self._snapshot.fingerprint
+        except FileNotFoundError:
+            return # Keep serving the last good catalogue
+
+        if not changed:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, daemon=True, name="catalogue-reload").start()
+
+    def _reload(self):
+        try:
+            fingerprint = self._stat()
+            if _file_hash(self.csv_path) == self._snapshot.sha256:
+                # Touched but identical: remember the new stat, keep the version
+                self._snapshot = self._snapshot._replace(fingerprint=fingerprint)
+                return
+            new_snapshot = self._build(version=self._snapshot.version + 1)
+            metrics.count("catalogue_reload")
+            # Single attribute assignment = atomic swap for readers
+            self._snapshot = new_snapshot
+        except Exception as e:
+            print(f"Catalogue Reload Error: {e}")
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def reload_now(self) -> CatalogueSnapshot:
+        """Synchronous reload (admin tools / tests)."""
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        self._snapshot = self._build(version)
+        return self._snapshot
+
+@process_resource
+def get_catalogue_store(csv_path: str = "cards.csv") -> CatalogueStore:
+    """One store per process, shared by every session."""
+    # Every (re)load queues the card images it needs, in the background
+    return CatalogueStore(csv_path, on_build=[warm_card_images])
+
+def get_card_catalogue(csv_path: str = "cards.csv") -> CatalogueSnapshot:
+    """
+    Current catalogue snapshot (version + DataFrame).
+    Returns an empty version-0 snapshot if the CSV is missing.
+    """
+    try:
+        return get_catalogue_store(csv_path).get()
 
     except FileNotFoundError:
+        import streamlit as st
         st.error(f"🚨 CRITICAL ERROR: '{csv_path}' not found. Please upload the CSV.")
-        return pd.DataFrame() # Return empty DF to prevent app crash
+        return CatalogueSnapshot(0, pd.DataFrame(), (0, 0)) # Empty DF prevents app crash
+
+def load_card_data(csv_path: str = "cards.csv") -> pd.DataFrame:
+    """
+    Loads the card catalogue (via the compiled cache) with safety defaults applied.
+    Returns a clean DataFrame ready for analysis.
+    """
+    return get_card_catalogue(csv_path).df
+
+# 1c. CARD IMAGES (Served from the local thumbnail cache, see image_cache.py)
+@process_resource
+def get_image_cache() -> ImageCache:
+    """One image cache (and fetch pool) per process."""
+    return ImageCache()
+
+def warm_card_images(snapshot: CatalogueSnapshot):
+    """Queues fetches for every Image_URL in the snapshot that is not cached yet."""
+    if 'Image_URL' in snapshot.df.columns:
+        get_image_cache().prefetch(snapshot.df['Image_URL'].dropna())
+
+def get_card_image(url):
+    """Thumbnail bytes for st.image, or None while the image is still being fetched."""
+    if not isinstance(url, str) or not url:
+        return None
+    return get_image_cache().get_or_schedule(url)
 
 # 2. SAVE DATA (The "Lead Gen" Connector)
+def freeze_secrets(section):
+    """A secrets section as sorted (key, value) pairs: hashable, unlike st.secrets' AttrDict."""
+    return tuple(sorted(dict(section).items()))
+
+@process_resource
+def get_lead_writer(service_account_items):
+    """One background writer per process (rows are batched with append_rows)."""
+    return LeadWriter(SheetsSink(dict(service_account_items)))
+
 def save_lead_to_sheets(salary, spends, top_card, savings):
     """
-    Saves user calculation results to Google Sheets for analytics.
+    Queues user calculation results for Google Sheets (written in the background).
     Fails silently so the user experience isn't interrupted.
     """
     try:
+        import streamlit as st
         # Check if secrets exist first
         if "gcp_service_account" not in st.secrets:
             return # Skip if running locally without keys
             
-        gc = gspread.service_account_from_dict(st.secrets["gcp_service_account"])
-        sh = gc.open("CredLens_Data")
-        worksheet = sh.sheet1
-        
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # We only save the total offline/online breakdown to keep it simple
         row = [timestamp, salary, spends['online'], spends['travel'], spends['offline'], top_card, savings]
         
-        worksheet.append_row(row)
+        if not get_lead_writer(freeze_secrets(st.secrets["gcp_service_account"])).submit(row):
+            print("Database Save Error: lead queue full, row dropped")
         
     except Exception as e:
         # Teacher Note: We print to console for us, but don't show error to user
@@ -83,4 +436,5 @@ if __name__ == "__main__":
     # because they expect a running Streamlit thread. 
     # For data_manager, it's often easier to test by importing it in a temp script.
     print("⚠️ Data Manager requires Streamlit context to test full loading.")
+    print(f"Compiled catalogue: {compile_card_catalogue()}")
     print("✅ Syntax Check Passed.")
\ No newline at end of file
@@ -0,0 +1,308 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import metrics
+
+try:
+    import fcntl
+except ImportError: # Windows: index updates are then only serialized within one process
+    fcntl = None
+
+# Card art is fetched once, shrunk to the size the results page shows it at and
+# kept on disk, so visitors' browsers never hot-link the banks' CDNs.
+# Pillow is imported on first resize (it is only needed on a cache miss).
+
+IMAGE_CACHE_DIR = ".image_cache"
+THUMB_WIDTH = 480             # px; the image column is ~240 px wide, x2 for sharp HiDPI screens
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+MEMORY_ITEMS = 256            # thumbnails kept in RAM per process
+FETCH_TIMEOUT = 5             # seconds per remote image
+RETRY_FAILED_AFTER = 600      # seconds before a failed URL is tried again
+TOUCH_EVERY = 60              # seconds between mtime bumps for a thumbnail served from memory
+USER_AGENT = "CredLens-ImageCache/1.0"
+
+# 1. FETCHERS (url -> original image bytes)
+def fetch_url(url, timeout=FETCH_TIMEOUT):
+    """Downloads one image (raises on HTTP errors, timeouts and non-http(s) URLs)."""
+    if urlsplit(url).scheme.lower() not in ("http", "https"):
+        raise ValueError(f"Only http(s) image URLs are fetched, got {url!r}")
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+class DirectoryFetcher:
+    """
+    Offline stand-in for fetch_url: serves files from a local folder, matched by
+    the URL's file name (card-face-cashback-sbi-card.png -> folder/card-face-cashback-sbi-card.png).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, url):
+        name = os.path.basename(url.split("?", 1)[0])
+        with open(os.path.join(self.path, name), "rb") as f:
+            return f.read()
+
+# 2. THUMBNAILS
+def make_thumbnail(data, width=THUMB_WIDTH):
+    """Resizes to at most width px wide (never enlarges) and re-encodes as WebP (transparency kept)."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "P") else "RGB")
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=85, method=4)
+        return out.getvalue()
+
+# 3. THE CACHE
+# Files are named after the SHA-256 of the thumbnail bytes (identical art used by
+# several cards is stored once). index.json maps url -> {hash, bytes}.
+# Several app processes share the folder, so:
+# - recency lives in the files' mtimes (bumped on every hit), not in the index;
+# - index.json is re-read and merged under an flock before each write;
+# - eviction scans the folder itself, so files no index mentions still count
+#   towards max_bytes and are dropped oldest-first.
+class ImageCache:
+    """Disk + memory cache of card thumbnails, shared by every session of a process."""
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, fetcher=fetch_url, width=THUMB_WIDTH,
+                 max_bytes=MAX_CACHE_BYTES, memory_items=MEMORY_ITEMS, workers=4):
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher
+        self.width = width
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # url -> thumbnail bytes
+        self._failed = {}             # url -> time of the last failed fetch
+        self._pending = set()
+        self._touched = {}            # url -> last mtime bump for memory hits
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-fetch")
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "fetched": 0, "failed": 0, "evicted": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index_mtime = None
+        self._index = self._read_index()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.webp")
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive across processes (flock on index.json.lock) and threads."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._index_path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def _read_index(self):
+        try:
+            self._index_mtime = os.stat(self._index_path).st_mtime_ns
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _refresh_index(self):
+        """Picks up URLs other processes cached since we last read index.json (caller holds _lock)."""
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._index_mtime:
+            self._index.update(self._read_index())
+
+    def _sync_index(self, added=None):
+        """
+        Merges our new entries into index.json as it is on disk now, evicts, and
+        writes it back (caller holds _file_lock). Entries whose file is gone are dropped.
+        """
+        index = self._read_index()
+        if added:
+            index.update(added)
+        self._evict(index)
+        index = {url: e for url, e in index.items() if os.path.exists(self._path(e["hash"]))}
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+        self._index_mtime = os.stat(self._index_path).st_mtime_ns
+        self._index = index
+        for url in [u for u in self._memory if u not in index]:
+            del self._memory[url]
+
+    def _touch(self, url, digest=None):
+        """Marks the file as recently used (its mtime is the LRU clock every process shares)."""
+        now = time.time()
+        if digest is None:
+            if now - self._touched.get(url, 0) < TOUCH_EVERY:
+                return
+            entry = self._index.get(url)
+            if entry is None:
+                return
+            digest = entry["hash"]
+        self._touched[url] = now
+        try:
+            os.utime(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, url, data):
+        self._memory[url] = data
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, url):
+        """Thumbnail bytes if cached (memory, then disk), else None. Never touches the network."""
+        with self._lock:
+            data = self._memory.get(url)
+            if data is not None:
+                self._memory.move_to_end(url)
+                self.stats["memory_hits"] += 1
+                self._touch(url)
+                return data
+            entry = self._index.get(url)
+            if entry is None:
+                self._refresh_index()
+                entry = self._index.get(url)
+
+        if entry is not None:
+            try:
+                with open(self._path(entry["hash"]), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = None
+                with self._lock:
+                    self._index.pop(url, None) # Evicted by another process; fetch it again
+            if data is not None:
+                with self._lock:
+                    self._touch(url, entry["hash"])
+                    self._remember(url, data)
+                    self.stats["disk_hits"] += 1
+                return data
+
+        with self._lock:
+            self.stats["misses"] += 1
+        metrics.count("image_cache_miss")
+        return None
+
+    def fetch(self, url):
+        """Fetches, resizes and stores one image; returns the thumbnail bytes (None on failure)."""
+        failed_at = self._failed.get(url)
+        if failed_at is not None and time.time() - failed_at < RETRY_FAILED_AFTER:
+            return None
+        try:
+            data = make_thumbnail(self.fetcher(url), self.width)
+        except Exception as e:
+            with self._lock:
+                self._failed[url] = time.time()
+                self.stats["failed"] += 1
+            print(f"Image Cache Error ({url}): {e}")
+            return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        else:
+            os.utime(path)
+        with self._file_lock():
+            self._failed.pop(url, None)
+            self._remember(url, data)
+            self.stats["fetched"] += 1
+            self._sync_index({url: {"hash": digest, "bytes": len(data)}})
+        metrics.count("image_fetch")
+        return data
+
+    def get_or_schedule(self, url):
+        """Cached bytes, or None after queueing a background fetch (the page never waits on a bank CDN)."""
+        data = self.get(url)
+        if data is None:
+            self.prefetch([url])
+        return data
+
+    def prefetch(self, urls):
+        """Queues background fetches for the URLs that are not cached yet. Returns the futures."""
+        futures = []
+        for url in dict.fromkeys(u for u in urls if isinstance(u, str) and u):
+            with self._lock:
+                self._refresh_index()
+                if url in self._index or url in self._pending:
+                    continue
+                self._pending.add(url)
+            futures.append(self._executor.submit(self._fetch_pending, url))
+        return futures
+
+    def _fetch_pending(self, url):
+        try:
+            return self.fetch(url)
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def _evict(self, index):
+        """Deletes least recently used files (by mtime) until the folder fits max_bytes (caller holds _file_lock)."""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".webp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        # Never evict the newest file, even if it alone is over budget
+        for _, size, path in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats["evicted"] += 1
+
+    def info(self):
+        with self._lock:
+            return {**self.stats, "urls": len(self._index), "bytes": sum(e["bytes"] for e in self._index.values())}
+
+# 4. PREFETCH JOB (python image_cache.py [cards.csv] [--from-dir folder])
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Fetch and resize all card images into the local cache.")
+    parser.add_argument("csv_path", nargs="?", default="cards.csv")
+    parser.add_argument("--from-dir", help="read images from this folder instead of the network")
+    parser.add_argument("--cache-dir", default=IMAGE_CACHE_DIR)
+    args = parser.parse_args()
+
+    cache = ImageCache(args.cache_dir, fetcher=DirectoryFetcher(args.from_dir) if args.from_dir else fetch_url)
+    for future in cache.prefetch(pd.read_csv(args.csv_path)["Image_URL"].dropna()):
+        future.result()
+    print(json.dumps(cache.info(), indent=2))
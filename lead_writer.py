@@ -0,0 +1,399 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import metrics
+
+try:
+    import fcntl
+except ImportError: # Windows: the spool is then only locked within one process
+    fcntl = None
+
+# gspread (and the google-auth/oauth stack behind it) is imported on first
+# connect: it is only needed when Sheets secrets exist.
+
+# 1. SINKS (Where the leads end up)
+# A sink only needs write_rows(rows). Anything it raises is treated as a failed
+# batch; errors that look like quota/rate limits are retried with backoff.
+
+class SheetsSink:
+    """Appends rows to the first worksheet of a Google Sheet (via the shared pool)."""
+
+    def __init__(self, service_account_info, sheet_name="CredLens_Data", client_factory=None):
+        self.pool = get_sheets_pool(service_account_info, sheet_name, client_factory)
+
+    def write_rows(self, rows):
+        self.pool.call(lambda worksheet: worksheet.append_rows(rows))
+
+class CsvSink:
+    """Local stand-in: appends rows to a CSV-like file (one JSON list per line)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write_rows(self, rows):
+        with self._lock, open(self.path, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+class SQLiteSink:
+    """Local stand-in: stores each row as JSON in a SQLite table."""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS leads (id INTEGER PRIMARY KEY, row TEXT)")
+
+    def write_rows(self, rows):
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.executemany("INSERT INTO leads (row) VALUES (?)", [(json.dumps(r),) for r in rows])
+
+    def read_rows(self):
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            return [json.loads(r) for (r,) in conn.execute("SELECT row FROM leads ORDER BY id")]
+
+def is_quota_error(error):
+    """True for rate-limit style errors (HTTP 429 or 'quota' in the message)."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "code", None)
+    return status == 429 or "quota" in str(error).lower()
+
+# 1b. SHEETS CONNECTION POOL
+# Building a gspread client means an OAuth token exchange and opening the
+# spreadsheet is a metadata fetch, so both are done once per process and
+# reused. google-auth refreshes the access token by itself when it expires;
+# we only rebuild when the API says the auth or the sheet is gone.
+
+def _is_not_found(error):
+    # Matched by name so checking errors never forces the gspread import
+    return type(error).__name__ in ("SpreadsheetNotFound", "WorksheetNotFound")
+
+def _is_reconnect_error(error):
+    """Auth / not-found errors that mean the cached client or worksheet is stale."""
+    if _is_not_found(error):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "code", None)
+    return status in (401, 403, 404)
+
+def _default_client_factory(service_account_info):
+    import gspread
+    return gspread.service_account_from_dict(service_account_info)
+
+class SheetsPool:
+    """
+    Thread-safe holder of one gspread client + worksheet handle.
+    client_factory(service_account_info) can be swapped for a fake in tests.
+    """
+
+    def __init__(self, service_account_info, sheet_name="CredLens_Data", client_factory=None):
+        self.service_account_info = service_account_info
+        self.sheet_name = sheet_name
+        self.client_factory = client_factory or _default_client_factory
+        self._lock = threading.Lock()
+        self._client = None
+        self._worksheet = None
+        self.stats = {"handshakes": 0, "opens": 0, "calls": 0, "reconnects": 0,
+                      "handshake_seconds": 0.0, "open_seconds": 0.0}
+
+    def worksheet(self):
+        """Returns the cached worksheet, connecting on first use."""
+        with self._lock:
+            if self._client is None:
+                start = time.perf_counter()
+                self._client = self.client_factory(self.service_account_info)
+                self.stats["handshakes"] += 1
+                metrics.count("sheets_handshake")
+                self.stats["handshake_seconds"] += time.perf_counter() - start
+            if self._worksheet is None:
+                start = time.perf_counter()
+                self._worksheet = self._client.open(self.sheet_name).sheet1
+                self.stats["opens"] += 1
+                self.stats["open_seconds"] += time.perf_counter() - start
+            return self._worksheet
+
+    def invalidate(self, client=True):
+        """Drops the worksheet (and by default the client) so the next call reconnects."""
+        with self._lock:
+            self._worksheet = None
+            if client:
+                self._client = None
+
+    def call(self, fn):
+        """Runs fn(worksheet), reconnecting once if the handle has gone stale."""
+        self.stats["calls"] += 1
+        metrics.count("sheets_call")
+        try:
+            return fn(self.worksheet())
+        except Exception as e:
+            if not _is_reconnect_error(e):
+                raise
+            self.stats["reconnects"] += 1
+            # Sheet missing only needs a re-open; auth errors need a new client
+            self.invalidate(client=not _is_not_found(e))
+            return fn(self.worksheet())
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_sheets_pool(service_account_info, sheet_name="CredLens_Data", client_factory=None):
+    """One pool per (service account, sheet) per process."""
+    key = (service_account_info.get("client_email"), sheet_name)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = SheetsPool(service_account_info, sheet_name, client_factory)
+        return _POOLS[key]
+
+def _reset_pools_after_fork():
+    # Connections must not be shared across forked worker processes
+    _POOLS.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+# 2. THE WRITER (Background queue + batching)
+class LeadWriter:
+    """
+    Collects lead rows on a bounded in-memory queue and writes them in batches
+    from a background thread, so the Streamlit script never waits on the network.
+
+    - Flushes when batch_size rows are waiting or flush_interval seconds pass.
+    - Quota errors are retried with exponential backoff (up to max_retries).
+    - Batches that still fail are spooled to a local JSONL file (shared by all
+      app processes, capped at max_spool_bytes) and replayed after the next
+      successful write. Spool lines that no longer parse are moved to <spool>.bad.
+    - Errors inside a pass are logged and never stop the worker; whatever is still
+      queued when the process exits is flushed from an atexit hook.
+    """
+
+    def __init__(self, sink, max_queue=1000, batch_size=50, flush_interval=5.0,
+                 spool_path="lead_spool.jsonl", max_retries=4, base_backoff=1.0,
+                 max_spool_bytes=5 * 1024 * 1024):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_spool_bytes = max_spool_bytes
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+        self._spool_lock = threading.Lock()
+        self.stats = {"submitted": 0, "dropped": 0, "written": 0, "batches": 0,
+                      "retries": 0, "spooled": 0, "replayed": 0, "spool_dropped": 0,
+                      "spool_corrupt": 0, "errors": 0}
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name="lead-writer")
+        self._thread.start()
+        atexit.register(self.close, 5.0)
+
+    def submit(self, row):
+        """Queues one row. Never blocks; returns False if the queue is full."""
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            metrics.count("lead_dropped")
+            return False
+        self.stats["submitted"] += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_requested.set()
+        return True
+
+    def flush(self, timeout=None):
+        """Asks the worker to write everything queued so far and waits for it."""
+        self._flush_requested.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10.0):
+        """Flushes and stops the worker thread."""
+        atexit.unregister(self.close)
+        self._stop.set()
+        self._flush_requested.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self._drain_safely()
+        self._drain_safely()
+
+    def _drain_safely(self):
+        # Disk errors or a damaged spool must not kill the thread: submit() would
+        # keep queueing rows that nothing ever writes
+        try:
+            self._drain()
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Lead Writer Error: {e}")
+
+    def _drain(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        if self._write_with_retries(batch):
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            # The sink is reachable again: send whatever earlier failures left behind
+            self._replay_spool()
+        else:
+            self._spool(batch)
+
+    def _write_with_retries(self, rows):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.write_rows(rows)
+                return True
+            except Exception as e:
+                if not is_quota_error(e) or attempt == self.max_retries:
+                    print(f"Lead Writer Error: {e}")
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(self.base_backoff * (2 ** attempt))
+
+    # 3. LOCAL SPOOL (Survives sink outages and restarts)
+    # Every app process shares one spool file, so all access holds an flock on
+    # <spool>.lock. A replay first renames the spool to a claim file owned by this
+    # process: rows other processes append meanwhile go to a fresh spool and are
+    # never touched, and no two processes replay the same rows.
+    def _locked(self):
+        return _SpoolLock(self.spool_path + ".lock", self._spool_lock)
+
+    def _claim_path(self, pid=None):
+        return f"{self.spool_path}.{pid or os.getpid()}.claim"
+
+    def _spool(self, rows, force=False):
+        """Appends rows to the spool; past max_spool_bytes new rows are dropped (force: never)."""
+        lines = "".join(json.dumps(row) + "\n" for row in rows)
+        with self._locked():
+            size = os.path.getsize(self.spool_path) if os.path.exists(self.spool_path) else 0
+            if not force and size + len(lines) > self.max_spool_bytes:
+                self.stats["spool_dropped"] += len(rows)
+                metrics.count("lead_dropped", len(rows))
+                print(f"Lead Writer Error: spool is full, dropping {len(rows)} rows")
+                return
+            with open(self.spool_path, "a") as f:
+                f.write(_line_break_needed(self.spool_path) + lines)
+        self.stats["spooled"] += len(rows)
+
+    def _claim_spool(self):
+        """Moves the spool (and claims left by dead processes) into this process's claim file."""
+        claim_path = self._claim_path()
+        with self._locked():
+            for path in glob.glob(glob.escape(self.spool_path) + ".*.claim"):
+                pid = path[len(self.spool_path) + 1:-len(".claim")]
+                if path != claim_path and pid.isdigit() and not _pid_alive(int(pid)):
+                    _append_file(path, claim_path)
+            if os.path.exists(self.spool_path):
+                _append_file(self.spool_path, claim_path)
+        return claim_path
+
+    def _replay_spool(self):
+        if not os.path.exists(self.spool_path) and not glob.glob(glob.escape(self.spool_path) + ".*.claim"):
+            return
+        claim_path = self._claim_spool()
+        if not os.path.exists(claim_path):
+            return
+        rows, corrupt = [], []
+        with open(claim_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError: # e.g. a line cut short by a crash mid-append
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            self._quarantine(corrupt)
+        sent = 0
+        for start in range(0, len(rows), self.batch_size):
+            if not self._write_with_retries(rows[start:start + self.batch_size]):
+                break
+            sent = min(start + self.batch_size, len(rows))
+        self.stats["written"] += sent
+        self.stats["replayed"] += sent
+        if sent < len(rows):
+            self._spool(rows[sent:], force=True) # Already counted against the cap once
+        os.remove(claim_path)
+
+    def _quarantine(self, lines):
+        """Keeps unreadable spool lines in <spool>.bad for a human to look at."""
+        with self._locked(), open(self.spool_path + ".bad", "a") as f:
+            f.writelines(lines)
+        self.stats["spool_corrupt"] += len(lines)
+        print(f"Lead Writer Error: moved {len(lines)} unreadable spool lines to {self.spool_path}.bad")
+
+class _SpoolLock:
+    """Thread lock + (where available) an exclusive flock on a side file."""
+
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self._file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            self._file.close() # Releases the flock
+            self._file = None
+        self.thread_lock.release()
+
+def _append_file(source, target):
+    """Moves source's lines onto the end of target (a plain rename when target is absent)."""
+    if not os.path.exists(target):
+        os.replace(source, target)
+        return
+    with open(source) as src, open(target, "a") as dst:
+        dst.write(_line_break_needed(target) + src.read())
+    os.remove(source)
+
+def _line_break_needed(path):
+    """What to write before appending: a newline if path ends in a partial line (a crashed append)."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return ""
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return "" if f.read(1) == b"\n" else "\n"
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True # Exists, owned by someone else
+    return True
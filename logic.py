@@ -1,12 +1,99 @@
-import streamlit as st
-from google import genai
+import itertools
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+import ai_advisor
+import metrics
+from resources import process_resource
 
 # 1. UTILITIES
-def format_inr(number):
-    """Converts a number (10000) into Indian Format (₹ 10,000)"""
-    s, *d = str(int(number)).partition(".")
-    r = ",".join([s[x-2:x] for x in range(-3, -len(s), -2)][::-1] + [s[-3:]])
-    return f"₹ {''.join([r] + d)}"
+# Indian grouping: last 3 digits, then pairs (₹ 1,23,45,678). Whole columns are
+# formatted by building a (values x characters) code-point matrix with NumPy and
+# viewing it as a string array, instead of one Python call per value.
+FORMAT_DEDUP_MIN = 256 # above this many values, format each distinct value once
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+_RUPEE, _SPACE, _MINUS, _COMMA, _DOT, _ZERO = (ord(c) for c in "₹ -,.0")
+
+def format_inr_array(values, decimals=0):
+    """
+    Formats a whole array/Series at once: [10000, -123456.7] -> ['₹ 10,000', '₹ -1,23,456'].
+    decimals=0 truncates to the rupee like int(); decimals=n rounds to n places.
+    Non-finite values come back as ''. Returns a NumPy array of str.
+    """
+    values = np.asarray(values, dtype=float)
+    flat = values.ravel()
+    if len(flat) > FORMAT_DEDUP_MIN:
+        # Result tables repeat values (fees, caps); format each distinct one once
+        unique, inverse = np.unique(flat, return_inverse=True)
+        if len(unique) < len(flat):
+            return format_inr_array(unique, decimals)[inverse].reshape(values.shape)
+    if not len(flat):
+        return np.empty(values.shape, dtype=str)
+
+    finite = np.isfinite(flat)
+    magnitude = np.abs(np.where(finite, flat, 0))
+    if decimals:
+        scaled = np.round(magnitude * 10 ** decimals).astype(np.int64)
+        whole, fraction = np.divmod(scaled, 10 ** decimals)
+        negative = (flat < 0) & (scaled > 0)
+    else:
+        whole = np.trunc(magnitude).astype(np.int64)
+        negative = (flat < 0) & (whole > 0)
+
+    # Digits, left to right, padded so the leading groups are full pairs
+    n_digits = np.maximum(np.searchsorted(_POW10, whole, side="right"), 1)
+    width = max(3, int(n_digits.max()))
+    width += (width - 3) % 2
+    commas = (width - 3) // 2
+    digits = (whole[:, None] // _POW10[width - 1::-1][None, :]) % 10 + _ZERO
+
+    # Body = grouped digits (+ decimals); digit i lands after the commas of the pairs before it
+    dest = np.arange(width) + np.minimum(np.arange(width) // 2, commas)
+    body = np.full((len(flat), width + commas + (decimals + 1 if decimals else 0)), _COMMA, dtype=np.uint32)
+    body[:, dest] = digits
+    if decimals:
+        body[:, width + commas] = _DOT
+        body[:, width + commas + 1:] = (fraction[:, None] // _POW10[decimals - 1::-1][None, :]) % 10 + _ZERO
+
+    # Shift each row left so it starts at its first significant digit, after "₹ " and the sign
+    first = dest[width - n_digits]
+    cols = np.arange(body.shape[1] + 3)[None, :] + (first - 2 - negative)[:, None]
+    inside = cols < body.shape[1]
+    chars = np.where(inside, np.take_along_axis(body, np.minimum(cols, body.shape[1] - 1), axis=1), 0)
+    chars[:, 0], chars[:, 1] = _RUPEE, _SPACE
+    chars[negative, 2] = _MINUS
+
+    text = np.ascontiguousarray(chars.astype(np.uint32)).view(f"U{chars.shape[1]}").ravel() # Trailing NULs are dropped
+    return np.where(finite, text, "").reshape(values.shape)
+
+def _group_indian(digits):
+    """'1234567' -> '12,34,567' (scalar twin of the matrix grouping above)."""
+    if len(digits) <= 3:
+        return digits
+    head = digits[:-3]
+    return ",".join([head[max(i - 2, 0):i] for i in range(len(head), 0, -2)][::-1] + [digits[-3:]])
+
+@lru_cache(maxsize=4096)
+def format_inr(number, decimals=0):
+    """Converts a number (10000) into Indian Format (₹ 10,000). Repeated values are memoized."""
+    # Plain Python: one value through NumPy costs more than the formatting itself
+    value = float(number)
+    if not math.isfinite(value):
+        return ""
+    if decimals:
+        scaled = round(abs(value) * 10 ** decimals)
+        whole, fraction = divmod(scaled, 10 ** decimals)
+        text = f"{_group_indian(str(whole))}.{fraction:0{decimals}d}"
+        negative = value < 0 and scaled > 0
+    else:
+        whole = int(abs(value))
+        text = _group_indian(str(whole))
+        negative = value < 0 and whole > 0
+    return f"₹ {'-' if negative else ''}{text}"
 
 # 2. CORE MATH (Pure Function)
 # logic.py
@@ -45,6 +132,18 @@ def calculate_card_yield(row, spends_dict):
     # Anything not in the buckets above falls into Offline/Base
     annual_offline = spends_dict.get('offline', 0) * 12
     reward_offline = annual_offline * (row.get('Base Rate', 0) / 100)
+
+    # 3b. PER-CATEGORY CAPS (Optional 'Online Cap' ... 'Base Cap' columns, monthly ₹)
+    def capped(reward, column):
+        cap = row.get(column)
+        return reward if cap is None or math.isnan(cap) else min(reward, cap * 12)
+
+    reward_online, reward_travel, reward_dining, reward_util, reward_upi, reward_offline = (
+        capped(reward, column) for reward, column in zip(
+            (reward_online, reward_travel, reward_dining, reward_util, reward_upi, reward_offline),
+            CATEGORY_CAP_COLUMNS,
+        )
+    )
     
     # 4. TOTAL GROSS REWARD
     raw_total_reward = (
@@ -65,6 +164,598 @@ def calculate_card_yield(row, spends_dict):
     # 6. NET SAVINGS (Profit)
     return actual_reward - row['Fee']
 
+# 2b. VECTORIZED SCORING (Whole catalogue in one pass)
+# Column order matters: rewards are summed in this order so results match
+# calculate_card_yield bit-for-bit. Each category's reward is clipped to its own
+# cap (category_caps x 12) before the sum, then the total to Monthly Cap x 12.
+SPEND_CATEGORIES = ('online', 'travel', 'dining', 'utilities', 'upi', 'offline')
+RATE_COLUMNS = ('Online Rate', 'Travel Rate', 'Dining Rate', 'Utility Rate', 'UPI Rate', 'Base Rate')
+# Optional per-category monthly reward caps (₹). Missing/blank = uncapped.
+# e.g. Airtel Axis: 10% on dining and utilities, but at most ₹250 a month each.
+CATEGORY_CAP_COLUMNS = ('Online Cap', 'Travel Cap', 'Dining Cap', 'Utility Cap', 'UPI Cap', 'Base Cap')
+
+def _category_caps(df, column):
+    caps = np.column_stack([column(col, np.inf) for col in CATEGORY_CAP_COLUMNS]) if len(df) else np.empty((0, len(CATEGORY_CAP_COLUMNS)))
+    return np.where(np.isnan(caps), np.inf, caps)
+
+def build_card_arrays(df):
+    """
+    Packs the catalogue into NumPy arrays for batch scoring.
+    Returns {"rates": (cards x categories) %, "cap": monthly cap, "fee": annual fee}.
+    Missing columns get the same defaults calculate_card_yield uses.
+    """
+    n = len(df)
+
+    def column(name, default):
+        if name in df.columns:
+            return df[name].to_numpy(dtype=float)
+        return np.full(n, default, dtype=float)
+
+    base = column('Base Rate', 0)
+    rates = np.empty((n, len(RATE_COLUMNS)), dtype=float)
+    for i, col in enumerate(RATE_COLUMNS):
+        # Utility Rate falls back to Base Rate, everything else to 0
+        rates[:, i] = base if (col == 'Utility Rate' and col not in df.columns) else column(col, 0)
+
+    cap = column('Monthly Cap', 999999)
+    # A blank cap never wins min() in the scalar version, so treat it as "no cap"
+    cap = np.where(np.isnan(cap), np.inf, cap)
+
+    category_caps = _category_caps(df, column)
+    lounge = (df['Lounge Access'] == 'Yes').to_numpy() if 'Lounge Access' in df.columns else np.zeros(n, dtype=bool)
+
+    return {
+        "rates": rates,
+        "cap": cap,
+        "fee": df['Fee'].to_numpy(dtype=float),
+        "min_income": column('Min Income', 0),
+        "lounge": lounge,
+        "market_rating": np.nan_to_num(column('Market_Rating', 0)),
+        "category_caps": category_caps,
+        # Per category: does any card cap it? Uncapped categories skip the clipping pass
+        "capped_categories": tuple(np.isfinite(category_caps).any(axis=0).tolist()),
+    }
+
+def subset_card_arrays(card_arrays, positions):
+    """Card arrays for just the given catalogue positions (catalogue-wide tuples are kept as is)."""
+    return {name: values if isinstance(values, tuple) else values[positions] for name, values in card_arrays.items()}
+
+def spend_vector(spends_dict):
+    """Turns the sidebar spends dict into a monthly spend vector (SPEND_CATEGORIES order)."""
+    return np.array([spends_dict.get(k, 0) for k in SPEND_CATEGORIES], dtype=float)
+
+def score_card_arrays(card_arrays, spends_dict):
+    """
+    Net Savings for every card at once (rates x spends, then caps, then fee).
+    Same math as calculate_card_yield, applied column-wise.
+    """
+    annual = spend_vector(spends_dict) * 12
+    rates = card_arrays["rates"]
+    category_caps = card_arrays["category_caps"]
+
+    raw_total_reward = np.zeros(rates.shape[0])
+    for i, capped in enumerate(card_arrays["capped_categories"]):
+        reward = annual[i] * (rates[:, i] / 100)
+        if capped:
+            np.minimum(reward, category_caps[:, i] * 12, out=reward)
+        raw_total_reward += reward
+
+    actual_reward = np.minimum(raw_total_reward, card_arrays["cap"] * 12)
+    return actual_reward - card_arrays["fee"]
+
+def score_cards(df, spends_dict):
+    """DataFrame convenience wrapper: returns a Net Savings array aligned with df rows."""
+    return score_card_arrays(build_card_arrays(df), spends_dict)
+
+class IncrementalScorer:
+    """
+    Keeps one contribution column per spend category for a fixed set of cards.
+    Changing one spend only recomputes that column, then re-applies cap and fee.
+    Columns are re-added in SPEND_CATEGORIES order, so results stay identical to
+    score_card_arrays (a running "+= delta" would drift in the last bits).
+    """
+
+    def __init__(self, card_arrays, spends_dict=None):
+        self.card_arrays = card_arrays
+        self.rates = card_arrays["rates"] / 100
+        self.annual_caps = card_arrays["category_caps"] * 12
+        self.monthly = np.zeros(len(SPEND_CATEGORIES))
+        self.contributions = np.zeros_like(self.rates)
+        self.columns_updated = 0
+        self._scores = None
+        self.set_spends(spends_dict or {})
+
+    def update(self, category, monthly_spend):
+        """Changes one category's monthly spend and returns the new Net Savings."""
+        i = SPEND_CATEGORIES.index(category)
+        if monthly_spend != self.monthly[i] or self._scores is None:
+            self.monthly[i] = monthly_spend
+            self.contributions[:, i] = np.minimum((monthly_spend * 12) * self.rates[:, i], self.annual_caps[:, i])
+            self.columns_updated += 1
+            self._scores = None
+        return self.scores
+
+    def set_spends(self, spends_dict):
+        """Applies a full spends dict; only categories that changed are recomputed."""
+        for i, value in enumerate(spend_vector(spends_dict)):
+            if value != self.monthly[i] or self._scores is None:
+                self.monthly[i] = value
+                self.contributions[:, i] = np.minimum((value * 12) * self.rates[:, i], self.annual_caps[:, i])
+                self.columns_updated += 1
+                self._scores = None
+        return self.scores
+
+    @property
+    def scores(self):
+        if self._scores is None:
+            raw_total_reward = np.zeros(self.rates.shape[0])
+            for i in range(len(SPEND_CATEGORIES)):
+                raw_total_reward += self.contributions[:, i]
+            self._scores = np.minimum(raw_total_reward, self.card_arrays["cap"] * 12) - self.card_arrays["fee"]
+        return self._scores
+
+def session_scorer(session_state, catalogue, eligible):
+    """
+    The session's IncrementalScorer for these eligible cards, rebuilt only when
+    the catalogue version or the eligible set changes.
+    """
+    cached = session_state.get("_incremental_scorer")
+    if cached is not None:
+        version, positions, scorer = cached
+        if version == catalogue.version and np.array_equal(positions, eligible):
+            return scorer
+    scorer = IncrementalScorer(subset_card_arrays(catalogue.card_arrays, eligible))
+    session_state["_incremental_scorer"] = (catalogue.version, eligible, scorer)
+    return scorer
+
+# 2c. BATCH PROFILES (Many users x whole catalogue)
+# Used for offline re-ranking of saved leads. Inputs are processed in chunks
+# so memory stays bounded no matter how many profiles come in.
+PROFILE_CHUNK_CELLS = 2_000_000 # profiles x cards per chunk (~16 MB per float matrix)
+
+def spend_matrix(spends_dicts):
+    """Stacks a list of spends dicts into an (N x categories) monthly spend matrix."""
+    return np.array([spend_vector(d) for d in spends_dicts], dtype=float).reshape(-1, len(SPEND_CATEGORIES))
+
+def _score_profile_chunk(card_arrays, spends, salaries, wants_lounge):
+    """Net Savings for one chunk of profiles. Ineligible cards come back as NaN."""
+    annual = spends * 12
+    rates = card_arrays["rates"]
+    category_caps = card_arrays["category_caps"]
+
+    raw_total_reward = np.zeros((annual.shape[0], rates.shape[0]))
+    for i, capped in enumerate(card_arrays["capped_categories"]):
+        reward = annual[:, i, None] * (rates[:, i] / 100)
+        if capped:
+            np.minimum(reward, category_caps[:, i] * 12, out=reward)
+        raw_total_reward += reward
+
+    net = np.minimum(raw_total_reward, card_arrays["cap"] * 12) - card_arrays["fee"]
+
+    # Eligibility masks: salary must clear Min Income, lounge seekers only see lounge cards
+    eligible = card_arrays["min_income"][None, :] <= salaries[:, None]
+    eligible &= card_arrays["lounge"][None, :] | ~wants_lounge[:, None]
+    net[~eligible] = np.nan
+    return net
+
+def iter_profile_scores(card_arrays, spends, salaries, wants_lounge=False, chunk_size=None):
+    """
+    Yields (start_row, net_savings_chunk) for an (N x categories) spend matrix.
+    Each chunk is (rows x cards); ineligible cards are NaN.
+    """
+    spends = np.asarray(spends, dtype=float).reshape(-1, len(SPEND_CATEGORIES))
+    salaries = np.asarray(salaries, dtype=float).reshape(-1)
+    wants_lounge = np.broadcast_to(np.asarray(wants_lounge, dtype=bool), salaries.shape)
+
+    if chunk_size is None:
+        # Size chunks by cells, not rows, so memory is the same for 20 or 100k cards
+        chunk_size = max(1, PROFILE_CHUNK_CELLS // max(1, len(card_arrays["fee"])))
+
+    for start in range(0, len(salaries), chunk_size):
+        stop = start + chunk_size
+        yield start, _score_profile_chunk(card_arrays, spends[start:stop], salaries[start:stop], wants_lounge[start:stop])
+
+def score_profiles(card_arrays, spends, salaries, wants_lounge=False, chunk_size=None):
+    """
+    Scores N profiles against the catalogue.
+    Returns {"net_savings": (N x cards), "best_index": (N,), "best_savings": (N,)}.
+    best_index is -1 (and best_savings NaN) when nothing is eligible.
+    """
+    salaries = np.asarray(salaries, dtype=float).reshape(-1)
+    net_savings = np.empty((len(salaries), len(card_arrays["fee"])))
+    for start, chunk in iter_profile_scores(card_arrays, spends, salaries, wants_lounge, chunk_size):
+        net_savings[start:start + len(chunk)] = chunk
+
+    best_index, best_savings = _best_per_row(net_savings)
+    return {"net_savings": net_savings, "best_index": best_index, "best_savings": best_savings}
+
+def best_card_per_profile(card_arrays, spends, salaries, wants_lounge=False, chunk_size=None):
+    """
+    Like score_profiles but only keeps the winner per user, so 1M+ profiles
+    run in chunk-sized memory. Returns {"best_index", "best_savings"}.
+    """
+    salaries = np.asarray(salaries, dtype=float).reshape(-1)
+    best_index = np.full(len(salaries), -1, dtype=np.int64)
+    best_savings = np.full(len(salaries), np.nan)
+    for start, chunk in iter_profile_scores(card_arrays, spends, salaries, wants_lounge, chunk_size):
+        stop = start + len(chunk)
+        best_index[start:stop], best_savings[start:stop] = _best_per_row(chunk)
+    return {"best_index": best_index, "best_savings": best_savings}
+
+def _best_per_row(net_savings):
+    """Argmax per row that skips NaN (ineligible) cells."""
+    if net_savings.shape[1] == 0:
+        return np.full(len(net_savings), -1, dtype=np.int64), np.full(len(net_savings), np.nan)
+    filled = np.where(np.isnan(net_savings), -np.inf, net_savings)
+    best_index = filled.argmax(axis=1)
+    has_any = ~np.isnan(net_savings).all(axis=1)
+    best_savings = np.where(has_any, filled[np.arange(len(filled)), best_index], np.nan)
+    return np.where(has_any, best_index, -1), best_savings
+
+ROW_SORT_MAX_CARDS = 4096 # up to this many cards, top_k_per_row sorts whole rows in one lexsort
+
+def top_k_per_row(card_arrays, net_savings, k=5):
+    """
+    Top-k card positions for every row of a (profiles x cards) Net Savings
+    matrix (NaN = ineligible), in the same order rank_scored gives.
+    Returns (rows x k) positions, padded with -1 where fewer cards are eligible.
+    """
+    n_rows, n_cards = net_savings.shape
+    k = min(k, n_cards)
+    filled = np.where(np.isnan(net_savings), -np.inf, net_savings)
+    if n_cards <= ROW_SORT_MAX_CARDS:
+        # Small catalogue: one vectorized sort for the whole batch beats n_rows partial selections
+        shape = filled.shape
+        keys = (
+            np.broadcast_to(np.arange(n_cards), shape),
+            np.broadcast_to(card_arrays["fee"], shape),
+            np.broadcast_to(-card_arrays["market_rating"], shape),
+            -filled,
+        )
+        top = np.lexsort(keys, axis=-1)[:, :k]
+    else:
+        top = np.array([top_k_cards(row, k, card_arrays["market_rating"], card_arrays["fee"]) for row in filled]).reshape(n_rows, k)
+    return np.where(np.isnan(np.take_along_axis(net_savings, top, axis=1)), -1, top)
+
+# 2d. MONTH-BY-MONTH ENGINE (Per-category caps, uneven spends)
+# The flat engines above cap 12 identical months at once (cap x 12). Real cards
+# cap each month separately, which matters when spends are seasonal: a festive
+# month over the cap loses the excess. This engine works on a cards x months x
+# categories array instead; for a flat schedule it gives the same Net Savings.
+# The service's /score uses it when a seasonality profile is sent.
+CARD_CHUNK_SIZE = 20000
+
+def spend_schedule(spends_dict, months=12, seasonality=None):
+    """
+    (months x categories) spend plan from the monthly averages.
+    seasonality: optional multipliers, shape (months,) or (months x categories),
+    e.g. a festive-season bump in Oct/Nov.
+    """
+    schedule = np.tile(spend_vector(spends_dict), (months, 1))
+    if seasonality is not None:
+        seasonality = np.asarray(seasonality, dtype=float)
+        schedule = schedule * (seasonality[:, None] if seasonality.ndim == 1 else seasonality)
+    return schedule
+
+def score_card_arrays_monthly(card_arrays, schedule):
+    """
+    Net Savings over the schedule with caps applied month by month:
+    1. reward per card/month/category, clipped to that category's monthly cap
+    2. monthly total clipped to Monthly Cap
+    3. months summed, Fee subtracted
+    Cards without per-category caps fall back to the flat Monthly Cap only.
+    """
+    schedule = np.asarray(schedule, dtype=float)
+    n = len(card_arrays["fee"])
+    net = np.empty(n)
+
+    # Chunk over cards so huge catalogues stay within a fixed working set
+    for start in range(0, n, CARD_CHUNK_SIZE):
+        stop = min(start + CARD_CHUNK_SIZE, n)
+        rates = card_arrays["rates"][start:stop] / 100
+        rewards = schedule[None, :, :] * rates[:, None, :]                     # cards x months x categories
+        rewards = np.minimum(rewards, card_arrays["category_caps"][start:stop, None, :])
+        monthly = np.minimum(rewards.sum(axis=2), card_arrays["cap"][start:stop, None])
+        net[start:stop] = monthly.sum(axis=1) - card_arrays["fee"][start:stop]
+    return net
+
+# 2e. RANKING (Top-K without sorting the whole catalogue)
+# Order: highest Net Savings, then higher Market_Rating, then lower Fee,
+# then catalogue position (so ties are always broken the same way).
+def _rank_order(positions, scores, market_rating, fee):
+    """Sorts the given positions by the ranking rules above."""
+    return positions[np.lexsort((positions, fee[positions], -market_rating[positions], -scores[positions]))]
+
+def _tiebreak_columns(scores, market_rating, fee):
+    n = len(scores)
+    market_rating = np.zeros(n) if market_rating is None else np.nan_to_num(np.asarray(market_rating, dtype=float))
+    fee = np.zeros(n) if fee is None else np.asarray(fee, dtype=float)
+    return market_rating, fee
+
+def top_k_cards(scores, k=5, market_rating=None, fee=None):
+    """
+    Positions of the k best cards, best first.
+    Uses a partial selection (argpartition) so cost is O(n + k log k).
+    """
+    scores = np.asarray(scores, dtype=float)
+    market_rating, fee = _tiebreak_columns(scores, market_rating, fee)
+    n = len(scores)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return _rank_order(np.arange(n), scores, market_rating, fee)
+
+    # k-th best score; keep everything at or above it so boundary ties are decided by the tie-breakers
+    kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    candidates = np.flatnonzero(scores >= kth_score)
+    return _rank_order(candidates, scores, market_rating, fee)[:k]
+
+def rank_all_cards(scores, market_rating=None, fee=None):
+    """Full ranking (same order as top_k_cards). Only needed for the detailed table."""
+    scores = np.asarray(scores, dtype=float)
+    market_rating, fee = _tiebreak_columns(scores, market_rating, fee)
+    return _rank_order(np.arange(len(scores)), scores, market_rating, fee)
+
+def rank_scored(card_arrays, positions, scores, k=None):
+    """
+    Ranks cards given as catalogue positions plus their scores.
+    Returns indexes into positions/scores, best first (all of them if k is None).
+    """
+    market_rating = card_arrays["market_rating"][positions]
+    fee = card_arrays["fee"][positions]
+    if k is None:
+        return rank_all_cards(scores, market_rating, fee)
+    return top_k_cards(scores, k, market_rating, fee)
+
+def scored_rows(df, positions, scores):
+    """Catalogue rows at positions with a 'Net Savings' column (only these rows are copied)."""
+    return df.iloc[positions].assign(**{'Net Savings': scores})
+
+# 2f. ELIGIBILITY INDEX (Built once per catalogue version)
+# Cards are presorted by Min Income, so "everything I can get on my salary"
+# is a prefix found by binary search. Yes/No filters are precomputed masks.
+# Each prefix is put back in catalogue order once and kept: the catalogue has
+# only a handful of distinct Min Income levels, so later salaries at the same
+# level reuse it instead of sorting again.
+ELIGIBILITY_PREFIX_CACHE = 64 # distinct income cutoffs kept per index
+class EligibilityIndex:
+    """Maps (salary, filters) to catalogue positions without scanning the DataFrame."""
+
+    def __init__(self, card_arrays):
+        min_income = card_arrays["min_income"]
+        # Stable sort keeps catalogue order inside each income level; NaN incomes sort last
+        self.order = np.argsort(min_income, kind="stable")
+        self.sorted_income = min_income[self.order]
+        self.masks = {
+            "lounge": card_arrays["lounge"],
+            "lifetime_free": card_arrays["fee"] == 0,
+        }
+        self._prefixes = OrderedDict() # cutoff -> read-only positions in catalogue order
+        self._lock = threading.Lock()
+
+    def _prefix(self, cutoff):
+        with self._lock:
+            positions = self._prefixes.get(cutoff)
+            if positions is not None:
+                self._prefixes.move_to_end(cutoff)
+                return positions
+        positions = np.sort(self.order[:cutoff])
+        positions.flags.writeable = False # Shared between callers
+        with self._lock:
+            self._prefixes[cutoff] = positions
+            while len(self._prefixes) > ELIGIBILITY_PREFIX_CACHE:
+                self._prefixes.popitem(last=False)
+        return positions
+
+    def candidates(self, salary, wants_lounge=False, **filters):
+        """
+        Positions (in catalogue order) of cards with Min Income <= salary that
+        pass every requested mask, e.g. candidates(50000, wants_lounge=True).
+        The result may be shared with other callers: treat it as read-only.
+        """
+        # side="right" keeps cards whose Min Income equals the salary; NaN never qualifies
+        cutoff = int(np.searchsorted(self.sorted_income, salary, side="right"))
+        positions = self._prefix(cutoff)
+
+        if wants_lounge:
+            filters["lounge"] = True
+        for name, wanted in filters.items():
+            if wanted:
+                positions = positions[self.masks[name][positions]] # Boolean indexing keeps the order
+        return positions
+
+# 2g. CARD PORTFOLIOS (Hold 2-3 cards, route each category to the best one)
+# A card earns min(rewards on the categories routed to it, Monthly Cap x 12), so
+# the best routing depends on the caps, not just on the higher rate. With 6
+# categories there are only 2^6 ways to split them between two cards: each
+# card's capped reward is precomputed for all 64 category subsets and a pair is
+# the best of its 64 splits (a cards x cards x splits tensor, built in chunks).
+# Pruning: cards are tried best-first and the search stops once no unseen card
+# can still make the top K. A card's bound is its reward on one part of a split
+# plus the best any card (or pair, for triples) nets on the rest, maximised over
+# splits. That is never more than the sum of single-card Net Savings, and much
+# tighter once caps make cards complement each other.
+PORTFOLIO_TOP_K = 3
+PORTFOLIO_CHUNK_CELLS = 4_000_000 # pairs x splits per block (~32 MB per float tensor)
+PORTFOLIO_START_POOL = 64
+TRIPLE_POOL_MAX = 48 # 3-card search only looks at this many of the best single cards
+
+_N_SUBSETS = 2 ** len(SPEND_CATEGORIES)
+_SUBSETS = ((np.arange(_N_SUBSETS)[:, None] >> np.arange(len(SPEND_CATEGORIES))) & 1).astype(float) # subsets x categories
+# Every way to hand the categories to 3 cards, as one subset id per card (729 x 3)
+_TRIPLE_SPLITS = np.array([
+    [sum(1 << i for i, owner in enumerate(assignment) if owner == card) for card in range(3)]
+    for assignment in itertools.product(range(3), repeat=len(SPEND_CATEGORIES))
+])
+_COMPLEMENT = _N_SUBSETS - 1 - np.arange(_N_SUBSETS)
+
+def subset_rewards(card_arrays, spends_dict):
+    """(cards x 64) capped annual reward of each card if it only gets that subset of categories."""
+    contributions = np.minimum((card_arrays["rates"] / 100) * (spend_vector(spends_dict) * 12), card_arrays["category_caps"] * 12)
+    return np.minimum(contributions @ _SUBSETS.T, card_arrays["cap"][:, None] * 12)
+
+def _combo_bounds(rewards, fee, best_rest):
+    """
+    Per card: max over subsets s of reward on s + best_rest[complement of s], minus
+    its fee. best_rest[t] bounds what the other card(s) can net on subset t.
+    """
+    bounds = np.empty(len(rewards))
+    rows = max(1, PORTFOLIO_CHUNK_CELLS // _N_SUBSETS)
+    for start in range(0, len(rewards), rows):
+        bounds[start:start + rows] = (rewards[start:start + rows] + best_rest[_COMPLEMENT]).max(axis=1)
+    return bounds - fee
+
+def _best_single_by_subset(rewards, fee):
+    """(64,) the best Net Savings any one card gets if it only receives subset s."""
+    return (rewards - fee[:, None]).max(axis=0)
+
+def _best_pair_by_subset(best_single):
+    """(64,) upper bound on what two cards net on subset t (best_single of the two parts)."""
+    parts = _TRIPLE_SPLITS[:, :2] # every disjoint (u, v); their union is t
+    best = np.full(_N_SUBSETS, -np.inf)
+    np.maximum.at(best, parts[:, 0] | parts[:, 1], best_single[parts[:, 0]] + best_single[parts[:, 1]])
+    return best
+
+def _tail_max(values):
+    """tail[i] = max(values[i:])."""
+    return np.maximum.accumulate(values[::-1])[::-1]
+
+def _used_subsets(spends_dict):
+    """True for subsets that carry some spend; a card routed nothing is not really in the portfolio."""
+    return _SUBSETS @ spend_vector(spends_dict) > 0
+
+def _top_combos(found, k):
+    """Keeps the k best of the (net, fee, members, split) candidates found so far."""
+    net, fee, members, split = (np.concatenate(parts) for parts in zip(*found))
+    order = np.lexsort(tuple(members[:, ::-1].T) + (fee, -net))[:k]
+    return [(net[order], fee[order], members[order], split[order])]
+
+def _block_candidates(net, fee, members, split, k):
+    """The k best finite entries of one evaluated block (ties at the boundary are all kept)."""
+    valid = np.flatnonzero(np.isfinite(net))
+    if len(valid) > k:
+        kth = net[valid[np.argpartition(-net[valid], k - 1)[k - 1]]]
+        valid = valid[net[valid] >= kth]
+    return net[valid], fee[valid], members[valid], split[valid]
+
+def _best_pairs(rewards, fee, single_net, used, k, fee_budget):
+    """Exact top-k pairs (indexes into rewards) with their best split, searching best single cards first."""
+    order = np.argsort(-single_net, kind="stable")
+    n = len(order)
+    split_ok = used & used[::-1] # Both cards get some spend (the complement of s is 63 - s)
+    # bound_tail[i]: the most any pair containing a card ranked i or lower can net
+    bound_tail = _tail_max(_combo_bounds(rewards, fee, _best_single_by_subset(rewards, fee))[order])
+    found, threshold, done, evaluated = [], -np.inf, 0, 0
+    pool = min(n, PORTFOLIO_START_POOL)
+
+    while done < pool:
+        cols = order[:pool]
+        rows_per_block = max(1, PORTFOLIO_CHUNK_CELLS // (pool * _N_SUBSETS))
+        for start in range(done, pool, rows_per_block):
+            stop = min(start + rows_per_block, pool)
+            rows = order[start:stop]
+            # New cards are paired with every card ranked above them, so each pair is seen once
+            totals = rewards[rows][:, None, :] + rewards[cols][None, :, ::-1]
+            totals[..., ~split_ok] = -np.inf
+            split = totals.argmax(axis=2)
+            pair_fee = fee[rows][:, None] + fee[cols][None, :]
+            net = np.take_along_axis(totals, split[..., None], axis=2)[..., 0] - pair_fee
+            net[np.arange(pool)[None, :] >= np.arange(start, stop)[:, None]] = -np.inf
+            if fee_budget is not None:
+                net[pair_fee > fee_budget] = -np.inf
+            evaluated += (stop - start) * start + (stop - start) * (stop - start - 1) // 2
+
+            # Members are listed best single card first: cols get the complement split, rows get s
+            members = np.stack(np.broadcast_arrays(cols[None, :], rows[:, None]), axis=2).reshape(-1, 2)
+            found.append(_block_candidates(net.ravel(), pair_fee.ravel(), members, split.ravel(), k))
+            found = _top_combos(found, k)
+
+        if len(found[0][0]) >= k:
+            threshold = found[0][0][-1]
+        done = pool
+        # Any unseen pair has a card ranked >= pool
+        if pool < n and bound_tail[pool] >= threshold:
+            pool = min(n, pool * 2)
+    return found[0] if found else None, evaluated
+
+def _best_triples(rewards, fee, single_net, used, k, fee_budget):
+    """Top-k triples among the best single cards (exact unless TRIPLE_POOL_MAX cut the search)."""
+    order = np.argsort(-single_net, kind="stable")
+    n = len(order)
+    split_ok = used[_TRIPLE_SPLITS].all(axis=1)
+    splits = _TRIPLE_SPLITS[split_ok]
+    if n < 3 or not len(splits):
+        return None, 0, True
+
+    bound_tail = _tail_max(_combo_bounds(rewards, fee, _best_pair_by_subset(_best_single_by_subset(rewards, fee)))[order])
+    pool = min(n, 16)
+    while True:
+        found = []
+        combos = order[np.array(list(itertools.combinations(range(pool), 3)))]
+        per_block = max(1, PORTFOLIO_CHUNK_CELLS // len(splits))
+        for start in range(0, len(combos), per_block):
+            block = combos[start:start + per_block]
+            totals = sum(rewards[block[:, card]][:, splits[:, card]] for card in range(3))
+            split = totals.argmax(axis=1)
+            triple_fee = fee[block].sum(axis=1)
+            net = totals[np.arange(len(block)), split] - triple_fee
+            if fee_budget is not None:
+                net[triple_fee > fee_budget] = -np.inf
+            found.append(_block_candidates(net, triple_fee, block, split, k))
+            found = _top_combos(found, k)
+
+        threshold = found[0][0][-1] if len(found[0][0]) >= k else -np.inf
+        bound = bound_tail[pool] if pool < n else -np.inf
+        if bound < threshold or pool == n or pool >= TRIPLE_POOL_MAX:
+            # Translate split rows back to the full 729-row table
+            net, triple_fee, members, split = found[0]
+            return (net, triple_fee, members, np.flatnonzero(split_ok)[split]), len(combos), bool(bound < threshold or pool == n)
+        pool = min(n, pool * 2, TRIPLE_POOL_MAX)
+
+def _combo_rows(combos, positions, subsets_per_card):
+    """Turns (net, fee, members, split) arrays into result dicts with catalogue positions."""
+    if combos is None:
+        return []
+    rows = []
+    for net, fee, members, split in zip(*combos):
+        cards = [int(positions[m]) for m in members]
+        owners = subsets_per_card(split)
+        routing = {cat: cards[next(c for c, subset in enumerate(owners) if subset >> i & 1)]
+                   for i, cat in enumerate(SPEND_CATEGORIES)}
+        rows.append({"positions": tuple(cards), "net_savings": float(net), "fee": float(fee), "routing": routing})
+    return rows
+
+def best_portfolios(card_arrays, positions, spends_dict, k=PORTFOLIO_TOP_K, triples=False, fee_budget=None):
+    """
+    Best 2-card (and with triples=True, 3-card) combinations among the given
+    catalogue positions. fee_budget caps a combination's combined annual fee.
+    Returns {"single": {"position", "net_savings"}, "pairs": [...], "triples": [...], "stats": {...}}.
+    Each combination is {"positions", "net_savings", "fee", "routing": {category: position}}.
+    Net Savings of a combination = rewards under its best routing - all its fees.
+    """
+    positions = np.asarray(positions)
+    arrays = subset_card_arrays(card_arrays, positions)
+    rewards = subset_rewards(arrays, spends_dict)
+    single_net = rewards[:, _N_SUBSETS - 1] - arrays["fee"]
+    used = _used_subsets(spends_dict)
+
+    result = {"single": None, "pairs": [], "triples": [], "stats": {"pairs_evaluated": 0, "triples_evaluated": 0, "triples_exact": True}}
+    if not len(positions):
+        return result
+    best = rank_scored(card_arrays, positions, single_net, k=1)[0]
+    result["single"] = {"position": int(positions[best]), "net_savings": float(single_net[best])}
+
+    pairs, result["stats"]["pairs_evaluated"] = _best_pairs(rewards, arrays["fee"], single_net, used, k, fee_budget)
+    result["pairs"] = _combo_rows(pairs, positions, lambda s: (_N_SUBSETS - 1 - s, s))
+    if triples:
+        found, result["stats"]["triples_evaluated"], result["stats"]["triples_exact"] = _best_triples(
+            rewards, arrays["fee"], single_net, used, k, fee_budget
+        )
+        # A third card only belongs in the list if it beats holding the best pair
+        best_pair = result["pairs"][0]["net_savings"] if result["pairs"] else result["single"]["net_savings"]
+        result["triples"] = [t for t in _combo_rows(found, positions, lambda s: _TRIPLE_SPLITS[s]) if t["net_savings"] > best_pair]
+    return result
+
 # 3. BREAK-EVEN LOGIC
 def calculate_break_even_stats(fee, net_savings, user_total_annual_spend):
     """
@@ -94,20 +785,240 @@ def calculate_break_even_stats(fee, net_savings, user_total_annual_spend):
         "pct_fill": pct_to_breakeven
     }
 
-# 4. AI INTEGRATION
-# Note: kept cached to save money/quota
-@st.cache_resource(show_spinner=False)
-def get_ai_verdict(salary, spends, card_name, savings):
+# 3a. BATCHED BREAK-EVEN (Every eligible card, many spend levels)
+# Same rules as calculate_break_even_stats, as array ops. Note the spend passed
+# in is the monthly total (as rank_profile always has), so break_even_spend is
+# the monthly spend needed to earn the fee back.
+BREAK_EVEN_NEVER = 9999999 # "never breaks even" value of the scalar version
+SWEEP_MULTIPLIERS = (0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 2.5, 3.0)
+
+def break_even_arrays(fee, net_savings, user_total_annual_spend):
     """
-    Calls Gemini to get a witty 1-line review.
+    calculate_break_even_stats for whole arrays (inputs broadcast together).
+    Returns break_even_spend (int), effective_rate and pct_fill, plus
+    pct_recovered: share of the fee the rewards pay back (0..1, 1 for free cards).
     """
-    try:
-        if "general" not in st.secrets or "gemini_api_key" not in st.secrets["general"]:
-            return None # Fail gracefully if no key
+    fee, net_savings, spend = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (fee, net_savings, user_total_annual_spend)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effective_rate = np.where(spend > 0, (net_savings + fee) / spend, 0.0)
+        break_even_spend = np.where(
+            effective_rate > 0, np.trunc(fee / effective_rate), np.where(fee > 0, BREAK_EVEN_NEVER, 0)
+        ).astype(np.int64)
+        pct_fill = np.where(break_even_spend > 0, np.minimum(1.0, spend / break_even_spend), 1.0)
+        pct_recovered = np.where(fee > 0, np.maximum(np.minimum(net_savings + fee, fee) / fee, 0.0), 1.0)
+    return {
+        "break_even_spend": break_even_spend,
+        "effective_rate": effective_rate,
+        "pct_fill": pct_fill,
+        "pct_recovered": pct_recovered,
+    }
+
+def break_even_sweep(card_arrays, positions, spends_dict, multipliers=SWEEP_MULTIPLIERS):
+    """
+    Scales the whole spend profile by each multiplier and re-scores the given cards.
+    Returns {"multipliers", "monthly_spend": (m,), "net_savings": (m x cards)} plus
+    the break_even_arrays fields, also (m x cards). Caps apply at every level.
+    """
+    multipliers = np.asarray(multipliers, dtype=float)
+    arrays = subset_card_arrays(card_arrays, positions)
+    spends = multipliers[:, None] * spend_vector(spends_dict)
+    net = _score_profile_chunk(arrays, spends, np.full(len(multipliers), np.inf), np.zeros(len(multipliers), dtype=bool))
+    monthly_spend = multipliers * spends_dict.get('total', 0)
+    return {
+        "multipliers": multipliers,
+        "monthly_spend": monthly_spend,
+        "net_savings": net,
+        **break_even_arrays(arrays["fee"][None, :], net, monthly_spend[:, None]),
+    }
+
+# 3b. FULL RANKING + SHARED RESULT CACHE
+# Many visitors keep the default inputs, so the whole ranking output is shared
+# across sessions. Keys include the catalogue version, so a reload makes old
+# entries unreachable (and they are dropped as soon as a new version is seen).
+TOP_K = 5
+
+def rank_profile(catalogue, salary, spends_dict, wants_lounge=False, k=TOP_K, session_state=None):
+    """
+    Runs filter -> score -> top-K -> break-even -> verdict for one profile.
+    catalogue needs .card_arrays and .eligibility (see data_manager.CatalogueSnapshot).
+    With a session_state, scoring reuses that session's IncrementalScorer.
+    """
+    card_arrays = catalogue.card_arrays
+    with metrics.stage("filter"):
+        eligible = catalogue.eligibility.candidates(salary, wants_lounge=wants_lounge)
+    with metrics.stage("score"):
+        if session_state is not None:
+            # Copy: the scorer keeps updating its own buffer on later reruns
+            scores = session_scorer(session_state, catalogue, eligible).set_spends(spends_dict).copy()
+        else:
+            scores = score_card_arrays(subset_card_arrays(card_arrays, eligible), spends_dict)
+    with metrics.stage("sort"):
+        top = rank_scored(card_arrays, eligible, scores, k=k)
+
+    result = {"eligible": eligible, "scores": scores, "top": top, "break_even": None, "verdict": None}
+    if len(top):
+        best_net = scores[top[0]]
+        best_fee = card_arrays["fee"][eligible[top[0]]]
+        with metrics.stage("break_even"):
+            stats = break_even_arrays(best_fee, best_net, spends_dict.get('total', 0))
+            result["break_even"] = {name: values.item() for name, values in stats.items()}
+        result["verdict"] = get_credlens_verdict(net_savings=best_net, fee=best_fee)
+
+    # Shared between sessions: make the arrays read-only
+    for name in ("eligible", "scores", "top"):
+        result[name].flags.writeable = False
+    return result
+
+def _approx_nbytes(value):
+    """Rough memory use of a memoized value (arrays exactly, containers/scalars estimated)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return 64 + sum(_approx_nbytes(k) + _approx_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 64 + sum(_approx_nbytes(v) for v in value)
+    return 32
+
+def _memoize(result, name, compute):
+    """
+    result[name], computing it on first use. When the result lives in a
+    ResultCache the value's size is added to that entry, so the byte budget
+    covers memos too. If two sessions race, the first value stored wins.
+    """
+    value = result.get(name)
+    if value is None:
+        computed = compute()
+        value = result.setdefault(name, computed)
+        slot = result.get("_cache_slot")
+        if value is computed and slot is not None:
+            cache, key = slot
+            cache.grow(key, _approx_nbytes(computed))
+    return value
+
+def full_ranking(catalogue, result):
+    """Every eligible card in rank order (indexes into result['scores']); memoized on the result."""
+    def compute():
+        order = rank_scored(catalogue.card_arrays, result["eligible"], result["scores"])
+        order.flags.writeable = False
+        return order
+    return _memoize(result, "full_order", compute)
+
+def break_even_table(catalogue, result, spends_dict):
+    """break_even_arrays for every eligible card (aligned with result['scores']); memoized on the result."""
+    def compute():
+        fee = catalogue.card_arrays["fee"][result["eligible"]]
+        return break_even_arrays(fee, result["scores"], spends_dict.get('total', 0))
+    return _memoize(result, "break_even_all", compute)
+
+def portfolio_ranking(catalogue, result, spends_dict, triples=False, fee_budget=None):
+    """best_portfolios over a rank_profile result's eligible cards; memoized on the result."""
+    def compute():
+        with metrics.stage("portfolio"):
+            return best_portfolios(catalogue.card_arrays, result["eligible"], spends_dict, triples=triples, fee_budget=fee_budget)
+    return _memoize(result, ("portfolios", bool(triples), fee_budget), compute)
+
+def result_key(catalogue_version, salary, spends_dict, wants_lounge):
+    """Canonical key: same numbers in a fixed category order, regardless of dict order or int/float."""
+    spends = tuple(float(spends_dict.get(cat, 0)) for cat in SPEND_CATEGORIES)
+    return (int(catalogue_version), float(salary), spends, float(spends_dict.get('total', 0)), bool(wants_lounge))
+
+class ResultCache:
+    """
+    Process-wide LRU of rank_profile results, bounded by approximate memory use.
+    Memos added to a cached result later (full ranking, break-even table,
+    portfolios) are charged to its entry through grow().
+    """
+
+    ENTRY_OVERHEAD = 1024 # bytes for the dicts/floats around the arrays
 
-        client = genai.Client(api_key=st.secrets["general"]["gemini_api_key"])
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
 
-        prompt = f"""
+    def get_or_compute(self, catalogue, salary, spends_dict, wants_lounge=False, session_state=None):
+        key = result_key(catalogue.version, salary, spends_dict, wants_lounge)
+        with self._lock:
+            if self._version != catalogue.version:
+                if self._entries:
+                    self.stats["invalidations"] += 1
+                self._entries.clear()
+                self._bytes = 0
+                self._version = catalogue.version
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                metrics.count("result_cache_hit")
+                return entry[0]
+            self.stats["misses"] += 1
+        metrics.count("result_cache_miss")
+
+        # Compute outside the lock; two sessions racing on a miss just both compute
+        result = rank_profile(catalogue, salary, spends_dict, wants_lounge, session_state=session_state)
+        size = self.ENTRY_OVERHEAD + sum(result[name].nbytes for name in ("eligible", "scores", "top"))
+
+        with self._lock:
+            if self._version == catalogue.version and key not in self._entries:
+                result["_cache_slot"] = (self, key)
+                self._entries[key] = (result, size)
+                self._bytes += size
+                self._evict()
+        return result
+
+    def grow(self, key, extra_bytes):
+        """Adds a memo's size to a cached entry (no-op if it was evicted meanwhile)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._entries[key] = (entry[0], entry[1] + extra_bytes)
+            self._bytes += extra_bytes
+            self._evict()
+
+    def _evict(self):
+        """Drops least recently used entries until within max_bytes (caller holds the lock)."""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.stats["evictions"] += 1
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def info(self):
+        return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "hit_rate": self.hit_rate()}
+
+@process_resource
+def get_result_cache():
+    """One shared result cache per process."""
+    return ResultCache()
+
+# 4. AI INTEGRATION
+# Note: cached (memory + disk, bucketed inputs) to save money/quota
+@process_resource
+def get_verdict_cache():
+    """Process-wide verdict cache; survives restarts via SQLite."""
+    return ai_advisor.VerdictCache()
+
+@process_resource
+def get_model_client(api_key):
+    """One managed Gemini client per process (reused connections, limits, breaker)."""
+    return ai_advisor.ManagedModel(ai_advisor.GeminiModel(api_key=api_key))
+
+@process_resource
+def get_verdict_flights():
+    """Process-wide single-flight table: identical concurrent requests share one call."""
+    return ai_advisor.SingleFlight()
+
+def build_verdict_prompt(salary, spends, card_name, savings):
+    """Prompt for the 1-line advisor verdict."""
+    return f"""
         User Spend: {format_inr(spends)}/month. Salary: {format_inr(salary)}.
         Best Card: {card_name} (Saves {format_inr(savings)}/yr).
         Role: Witty financial Advisor
@@ -115,17 +1026,55 @@ def get_ai_verdict(salary, spends, card_name, savings):
         Output: 1 punchy sentence (<20 words).
         """
 
-        response = client.models.generate_content(
-            model='gemini-2.5-flash-lite', # Updated to 2.0 as per discussion
-            contents=prompt
+def start_ai_verdict(salary, spends, card_name, savings, model=None):
+    """
+    Starts a Gemini verdict in the background and returns an ai_advisor.VerdictJob
+    (already finished on a cache hit). Returns None if AI is not configured.
+    Similar profiles (same bands + card) share one cached answer.
+    """
+    try:
+        if model is None:
+            import streamlit as st # Only the app has secrets; other callers pass a model
+            if "general" not in st.secrets or "gemini_api_key" not in st.secrets["general"]:
+                return None # Fail gracefully if no key
+            model = get_model_client(st.secrets["general"]["gemini_api_key"])
+
+        cache = get_verdict_cache()
+        key = ai_advisor.verdict_key(salary, spends, card_name, savings)
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.count("verdict_cache_hit")
+            return ai_advisor.VerdictJob.completed(cached)
+        metrics.count("verdict_cache_miss")
+
+        # Prompt uses the banded numbers so the shared answer fits everyone in the band
+        prompt = build_verdict_prompt(
+            salary=ai_advisor.bucket(salary, ai_advisor.SALARY_BAND),
+            spends=ai_advisor.bucket(spends, ai_advisor.SPEND_BAND),
+            card_name=card_name,
+            savings=ai_advisor.bucket(savings, ai_advisor.SAVINGS_BAND),
         )
+        # Jobs write the cache before they count as done, so the re-check under the
+        # single-flight lock closes the gap between our cache miss and run()
+        def find_done():
+            text = cache.get(key)
+            return ai_advisor.VerdictJob.completed(text) if text is not None else None
 
-        return response.text
+        return get_verdict_flights().run(
+            key, lambda: ai_advisor.VerdictJob.submit(model, prompt, on_done=lambda text: cache.set(key, text)), find_done
+        )
 
     except Exception as e:
         # Log error internally but return None so UI doesn't break
         print(f"AI Error: {e}")
         return None
+
+def get_ai_verdict(salary, spends, card_name, savings, timeout=ai_advisor.AI_DEADLINE_SECONDS):
+    """
+    Calls Gemini to get a witty 1-line review (blocking, with a hard deadline).
+    """
+    job = start_ai_verdict(salary, spends, card_name, savings)
+    return job.result(timeout) if job else None
     
 # logic.py
 
@@ -0,0 +1,156 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# 1. SETTINGS
+# CREDLENS_METRICS_SAMPLE: fraction of reruns whose stages are timed (1.0 = all).
+# Counters are always recorded; they are a single dict update.
+SAMPLE_RATE = float(os.environ.get("CREDLENS_METRICS_SAMPLE", "1.0"))
+EXPORT_PATH = os.environ.get("CREDLENS_METRICS_PATH", "metrics_snapshot")  # writes .json and .prom
+EXPORT_INTERVAL = float(os.environ.get("CREDLENS_METRICS_EXPORT_SECONDS", "30"))
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 2. REGISTRY (Process-wide, thread-safe)
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # last bucket = +Inf
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (good enough for tail hunting)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+        self._last_export = time.monotonic()
+
+    def observe(self, name, ms):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(ms)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Machine-readable view of everything recorded so far."""
+        with self._lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "sample_rate": SAMPLE_RATE,
+                "counters": dict(self.counters),
+                "stages_ms": {
+                    name: {
+                        "count": h.count,
+                        "sum": h.total_ms,
+                        "mean": h.total_ms / h.count if h.count else None,
+                        "p50": h.quantile(0.50),
+                        "p99": h.quantile(0.99),
+                        "max": h.max_ms,
+                        "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["+Inf"], h.counts)),
+                    }
+                    for name, h in self.histograms.items()
+                },
+            }
+
+    def prometheus_text(self):
+        """Prometheus text exposition format (for a node-exporter textfile collector)."""
+        lines = ["# TYPE credlens_stage_seconds histogram"]
+        with self._lock:
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, c in zip(list(BUCKETS_MS) + [None], h.counts):
+                    cumulative += c
+                    le = "+Inf" if bound is None else repr(bound / 1000)
+                    lines.append(f'credlens_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'credlens_stage_seconds_sum{{stage="{name}"}} {h.total_ms / 1000}')
+                lines.append(f'credlens_stage_seconds_count{{stage="{name}"}} {h.count}')
+            lines.append("# TYPE credlens_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'credlens_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=EXPORT_PATH):
+        """Writes <path>.json and <path>.prom atomically."""
+        for suffix, payload in ((".json", json.dumps(self.snapshot(), indent=2)), (".prom", self.prometheus_text())):
+            tmp_path = f"{path}{suffix}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, path + suffix)
+
+    def maybe_export(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_export < EXPORT_INTERVAL:
+                return
+            self._last_export = now
+        try:
+            self.export()
+        except OSError as e:
+            print(f"Metrics Export Error: {e}")
+
+REGISTRY = Registry()
+_local = threading.local()
+
+# 3. API (What app.py and the other modules call)
+def start_run():
+    """Call at the top of each rerun; decides whether this rerun is sampled."""
+    _local.sampled = SAMPLE_RATE >= 1.0 or random.random() < SAMPLE_RATE
+    _local.run_start = time.perf_counter()
+
+def end_run():
+    """Call at the end of each rerun; records the total and exports every EXPORT_INTERVAL seconds."""
+    if getattr(_local, "sampled", False):
+        REGISTRY.observe("rerun_total", (time.perf_counter() - _local.run_start) * 1000)
+    REGISTRY.count("reruns")
+    REGISTRY.maybe_export()
+
+@contextmanager
+def stage(name):
+    """Times a block into the '<name>' histogram (no-op when the rerun isn't sampled)."""
+    if not getattr(_local, "sampled", SAMPLE_RATE >= 1.0):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, (time.perf_counter() - start) * 1000)
+
+def count(name, n=1):
+    """Bumps an event counter (cache hits, external calls, ...)."""
+    REGISTRY.count(name, n)
+
+def snapshot():
+    return REGISTRY.snapshot()
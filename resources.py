@@ -0,0 +1,40 @@
+import functools
+import sys
+import threading
+
+# Shared, process-wide objects (caches, clients, pools) are created through
+# process_resource. Inside the Streamlit app it is st.cache_resource, exactly
+# as before. In Streamlit-free processes (service.py, benchmarks, scripts) it is
+# a plain memo, so importing logic/data_manager never pulls Streamlit in.
+
+def process_resource(fn):
+    """
+    Decorator: one result per distinct arguments, per process.
+    The backend is picked on first call: st.cache_resource if Streamlit is
+    already imported, functools.cache otherwise. .clear() drops everything.
+    """
+    backend = None
+    lock = threading.Lock()
+
+    def resolve():
+        nonlocal backend
+        if backend is None:
+            with lock:
+                if backend is None:
+                    if "streamlit" in sys.modules:
+                        import streamlit as st
+                        backend = st.cache_resource(show_spinner=False)(fn)
+                    else:
+                        backend = functools.cache(fn)
+        return backend
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return resolve()(*args, **kwargs)
+
+    def clear():
+        cached = resolve()
+        (cached.clear if hasattr(cached, "clear") else cached.cache_clear)()
+
+    wrapper.clear = clear
+    return wrapper
@@ -0,0 +1,585 @@
+"""
+CredLens scoring service: logic.py over a local HTTP/JSON API, without Streamlit.
+
+    python service.py serve --port 8600                  # one process, pooled threads
+    python service.py serve --port 8600 --processes 4    # one process per core (SO_REUSEPORT)
+    python service.py loadgen --url http://127.0.0.1:8600 --seconds 10
+
+Endpoints (JSON in, JSON out; HTTP/1.1 keep-alive):
+    POST /rank        {"salary", "spends": {...}, "wants_lounge", "k"}  or  {"profiles": [ ... ]}
+    POST /score       {"card", "spends", "salary"?, "seasonality"?}  (12 monthly multipliers, or 12 x 6 per category)
+    POST /break-even  {"fee", "net_savings", "monthly_spend"} (numbers or lists)  or  {"card", "spends", "sweep"?}
+    POST /verdict     {"net_savings", "fee"}  or  {"card", "spends"}; add "ai": true for the Gemini line
+    GET  /health, GET /metrics
+"""
+import argparse
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import data_manager
+import logic
+import metrics
+
+# 1. SETTINGS
+DEFAULT_PORT = 8600
+DEFAULT_WORKERS = 32           # request threads per process (one per open keep-alive connection)
+MAX_BATCH = 256                # rank requests scored together in one matrix pass
+MAX_BODY_BYTES = 1024 * 1024
+RESPONSE_CACHE_ITEMS = 4096    # encoded /rank answers per process, keyed like logic.result_key
+KEEP_ALIVE_SECONDS = 30        # idle connections are closed after this long
+
+class BadRequest(ValueError):
+    """Client error; answered with HTTP 400 and {"error": message}."""
+
+class NotFound(LookupError):
+    """Unknown path or card; answered with HTTP 404."""
+
+# 2. CATALOGUE (Loaded once per process, reloaded in the background on change)
+class CardLookups(NamedTuple):
+    """Per-version plain-Python columns (cheaper than NumPy scalars when building JSON)."""
+    names: list
+    fee: list
+    market_rating: list
+    by_name: dict       # lower-cased name -> position (first row wins on duplicates)
+
+class Catalogue:
+    """CatalogueStore plus per-version lookups for building responses."""
+
+    def __init__(self, csv_path="cards.csv"):
+        self.store = data_manager.CatalogueStore(csv_path)
+        self._lookups = (None, None)  # (version, CardLookups)
+
+    def get_with_lookups(self):
+        snapshot = self.store.get()
+        version, lookups = self._lookups
+        if version != snapshot.version:
+            names = snapshot.df['Card Name'].astype(str).tolist()
+            lookups = CardLookups(
+                names,
+                snapshot.card_arrays["fee"].tolist(),
+                snapshot.card_arrays["market_rating"].tolist(),
+                {name.lower(): i for i, name in reversed(list(enumerate(names)))},
+            )
+            self._lookups = (snapshot.version, lookups)
+        return snapshot, lookups
+
+    def position(self, card_name):
+        snapshot, lookups = self.get_with_lookups()
+        position = lookups.by_name.get(str(card_name).strip().lower())
+        if position is None:
+            raise NotFound(f"Unknown card: {card_name}")
+        return snapshot, lookups, position
+
+def parse_spends(raw):
+    """Request spends -> the app's spends dict (monthly ₹; 'total' defaults to the sum)."""
+    if not isinstance(raw, dict):
+        raise BadRequest("'spends' must be an object of monthly amounts")
+    spends = {}
+    for category in logic.SPEND_CATEGORIES:
+        value = _number(raw.get(category, 0), f"spends.{category}")
+        if value < 0:
+            raise BadRequest(f"spends.{category} must not be negative")
+        spends[category] = value
+    spends['total'] = _number(raw['total'], "spends.total") if 'total' in raw else sum(spends.values())
+    return spends
+
+def parse_seasonality(raw):
+    """12 monthly spend multipliers, or a 12 x categories grid of them."""
+    try:
+        seasonality = np.asarray(raw, dtype=float)
+    except (TypeError, ValueError):
+        raise BadRequest("'seasonality' must be a list of numbers") from None
+    if seasonality.shape not in ((12,), (12, len(logic.SPEND_CATEGORIES))):
+        raise BadRequest(f"'seasonality' must have 12 rows (optionally x {len(logic.SPEND_CATEGORIES)} categories)")
+    if not np.isfinite(seasonality).all() or (seasonality < 0).any():
+        raise BadRequest("'seasonality' must be finite and not negative")
+    return seasonality
+
+def _number(value, name):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"'{name}' must be a number") from None
+    if not np.isfinite(value):
+        raise BadRequest(f"'{name}' must be finite")
+    return value
+
+def _flag(value, name):
+    # Only real JSON booleans: bool("false") would be True
+    if not isinstance(value, bool):
+        raise BadRequest(f"'{name}' must be true or false")
+    return value
+
+# 3. BATCHED RANKING
+# Each request thread queues its profile and waits. One scorer thread takes
+# everything queued so far (up to MAX_BATCH) and scores it as a single
+# profiles x cards matrix (logic.iter_profile_scores). Under load many requests
+# share one pass; when idle a request is scored on its own, with no added wait.
+class ProfileBatcher:
+    def __init__(self, catalogue, max_batch=MAX_BATCH):
+        self.catalogue = catalogue
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self.stats = {"batches": 0, "profiles": 0, "largest_batch": 0}
+        threading.Thread(target=self._run, daemon=True, name="rank-batcher").start()
+
+    def submit(self, salary, spends, wants_lounge=False, k=logic.TOP_K):
+        future = Future()
+        self._queue.put((salary, spends, bool(wants_lounge), int(k), future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._score(batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _score(self, batch):
+        snapshot, lookups = self.catalogue.get_with_lookups()
+        card_arrays = snapshot.card_arrays
+        spends = logic.spend_matrix([item[1] for item in batch])
+        salaries = np.array([item[0] for item in batch], dtype=float)
+        wants_lounge = np.array([item[2] for item in batch], dtype=bool)
+        totals = np.array([item[1]['total'] for item in batch], dtype=float)
+        k = max(item[3] for item in batch)
+
+        with metrics.stage("service_rank_batch"):
+            for start, chunk in logic.iter_profile_scores(card_arrays, spends, salaries, wants_lounge):
+                # Rank, break-even and verdict for the whole chunk at once; only the JSON dicts are per row
+                top = logic.top_k_per_row(card_arrays, chunk, k)
+                rows = np.arange(len(chunk))
+                top_scores = chunk[rows[:, None], np.maximum(top, 0)]
+                eligible = (~np.isnan(chunk)).sum(axis=1)
+                best = np.maximum(top[:, 0], 0) if top.shape[1] else np.zeros(len(chunk), dtype=np.int64)
+                best_fee = card_arrays["fee"][best]
+                be = logic.break_even_arrays(best_fee, top_scores[:, 0] if top.shape[1] else 0, totals[start:start + len(chunk)])
+                be = {name: values.tolist() for name, values in be.items()}
+
+                for offset, (positions, scores) in enumerate(zip(top.tolist(), top_scores.tolist())):
+                    future, row_k = batch[start + offset][4], batch[start + offset][3]
+                    future.set_result(ranking_payload(
+                        snapshot.version, lookups, int(eligible[offset]),
+                        [(p, sc) for p, sc in zip(positions[:row_k], scores[:row_k]) if p >= 0],
+                        {name: values[offset] for name, values in be.items()},
+                    ))
+
+        self.stats["batches"] += 1
+        self.stats["profiles"] += len(batch)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        metrics.count("service_rank_profiles", len(batch))
+
+def card_payload(lookups, position, net_savings):
+    return {
+        "card": lookups.names[position],
+        "net_savings": round(net_savings, 2),
+        "fee": lookups.fee[position],
+        "market_rating": lookups.market_rating[position],
+    }
+
+def break_even_payload(fee, net_savings, monthly_spend):
+    """logic.break_even_arrays as plain JSON values (lists stay lists)."""
+    stats = logic.break_even_arrays(fee, net_savings, monthly_spend)
+    return {name: values.tolist() for name, values in stats.items()}
+
+def ranking_payload(version, lookups, eligible, top, best_break_even):
+    """Same fields the results page shows: top cards, plus verdict and break-even for the winner."""
+    cards = [card_payload(lookups, position, score) for position, score in top]
+    payload = {"catalogue_version": version, "eligible": eligible, "cards": cards, "best": None}
+    if cards:
+        best_position, best_net = top[0]
+        payload["best"] = {
+            "card": cards[0]["card"],
+            "verdict": logic.get_credlens_verdict(net_savings=best_net, fee=lookups.fee[best_position]),
+            "break_even": best_break_even,
+        }
+    return payload
+
+# 4. HANDLERS (payload dict -> response dict; no HTTP in here)
+class ScoringService:
+    def __init__(self, csv_path="cards.csv"):
+        self.catalogue = Catalogue(csv_path)
+        self.catalogue.get_with_lookups() # Load before the first request
+        self.batcher = ProfileBatcher(self.catalogue)
+        self._responses = OrderedDict()
+        self._responses_lock = threading.Lock()
+        self.routes = {
+            ("POST", "/rank"): self.rank,
+            ("POST", "/score"): self.score,
+            ("POST", "/break-even"): self.break_even,
+            ("POST", "/verdict"): self.verdict,
+            ("GET", "/health"): self.health,
+        }
+
+    def _rank_request(self, payload):
+        if not isinstance(payload, dict):
+            raise BadRequest("each profile must be an object")
+        salary = _number(payload.get("salary", 0), "salary")
+        spends = parse_spends(payload.get("spends", {}))
+        k = int(_number(payload.get("k", logic.TOP_K), "k"))
+        if not 1 <= k <= 100:
+            raise BadRequest("'k' must be between 1 and 100")
+        return salary, spends, _flag(payload.get("wants_lounge", False), "wants_lounge"), k
+
+    def rank(self, payload):
+        """Top cards for one profile, or for {"profiles": [...]} (all scored in the same batch)."""
+        profiles = payload.get("profiles") if isinstance(payload, dict) else None
+        requests = [self._rank_request(p) for p in (profiles if isinstance(profiles, list) else [payload])]
+
+        version = self.catalogue.get_with_lookups()[0].version
+        keys = [(logic.result_key(version, salary, spends, lounge), k) for salary, spends, lounge, k in requests]
+        results, futures = [None] * len(requests), {}
+        with self._responses_lock:
+            for i, key in enumerate(keys):
+                cached = self._responses.get(key)
+                if cached is not None:
+                    self._responses.move_to_end(key)
+                    results[i] = cached
+        metrics.count("service_rank_cache_hit", sum(r is not None for r in results))
+
+        for i, request in enumerate(requests):
+            if results[i] is None:
+                futures[i] = self.batcher.submit(*request)
+        for i, future in futures.items():
+            results[i] = future.result()
+            with self._responses_lock:
+                self._responses[keys[i]] = results[i]
+                while len(self._responses) > RESPONSE_CACHE_ITEMS:
+                    self._responses.popitem(last=False)
+
+        return {"results": results} if isinstance(profiles, list) else results[0]
+
+    def _score_card(self, payload):
+        if "card" not in payload:
+            raise BadRequest("'card' is required")
+        snapshot, lookups, position = self.catalogue.position(payload["card"])
+        spends = parse_spends(payload.get("spends", {}))
+        card_arrays = logic.subset_card_arrays(snapshot.card_arrays, [position])
+        if payload.get("seasonality") is not None:
+            # Uneven months: caps bite month by month, so use the month-by-month engine
+            schedule = logic.spend_schedule(spends, seasonality=parse_seasonality(payload["seasonality"]))
+            net = float(logic.score_card_arrays_monthly(card_arrays, schedule)[0])
+        else:
+            net = float(logic.score_card_arrays(card_arrays, spends)[0])
+        return snapshot, lookups, position, spends, net
+
+    def score(self, payload):
+        """Net Savings (plus break-even and verdict) for one named card."""
+        snapshot, lookups, position, spends, net = self._score_card(payload)
+        fee = lookups.fee[position]
+        result = {
+            **card_payload(lookups, position, net),
+            "verdict": logic.get_credlens_verdict(net_savings=net, fee=fee),
+            "break_even": break_even_payload(fee, net, spends['total']),
+        }
+        if "salary" in payload:
+            result["eligible"] = bool(snapshot.card_arrays["min_income"][position] <= _number(payload["salary"], "salary"))
+        return result
+
+    def break_even(self, payload):
+        """Batched break-even for raw numbers/lists, or for a named card (optionally swept 0.5x-3x)."""
+        if "card" not in payload:
+            try:
+                return break_even_payload(payload["fee"], payload["net_savings"], payload.get("monthly_spend", 0))
+            except KeyError as e:
+                raise BadRequest(f"'{e.args[0]}' is required") from None
+            except (TypeError, ValueError):
+                raise BadRequest("'fee', 'net_savings' and 'monthly_spend' must be numbers or equal-length lists") from None
+
+        snapshot, lookups, position, spends, net = self._score_card(payload)
+        result = {"card": lookups.names[position], **break_even_payload(lookups.fee[position], net, spends['total'])}
+        multipliers = payload.get("sweep")
+        if multipliers is not None and not isinstance(multipliers, list):
+            multipliers = logic.SWEEP_MULTIPLIERS if _flag(multipliers, "sweep") else None
+        if multipliers:
+            sweep = logic.break_even_sweep(snapshot.card_arrays, [position], spends, [_number(m, "sweep") for m in multipliers])
+            result["sweep"] = {name: values[:, 0].tolist() if values.ndim == 2 else values.tolist() for name, values in sweep.items()}
+        return result
+
+    def verdict(self, payload):
+        """CredLens ROI verdict; with "ai": true also the cached/coalesced Gemini line (needs GEMINI_API_KEY)."""
+        if "card" in payload:
+            snapshot, lookups, position, spends, net = self._score_card(payload)
+            card_name, fee = lookups.names[position], lookups.fee[position]
+        else:
+            card_name, spends = payload.get("card_name"), None
+            net, fee = _number(payload.get("net_savings"), "net_savings"), _number(payload.get("fee"), "fee")
+
+        result = {"verdict": logic.get_credlens_verdict(net_savings=net, fee=fee)}
+        if _flag(payload.get("ai", False), "ai"):
+            result["ai_verdict"] = None
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if api_key and card_name:
+                total = spends['total'] if spends else _number(payload.get("monthly_spend", 0), "monthly_spend")
+                job = logic.start_ai_verdict(
+                    salary=_number(payload.get("salary", 0), "salary"), spends=total, card_name=card_name,
+                    savings=net, model=logic.get_model_client(api_key),
+                )
+                result["ai_verdict"] = job.result() if job else None
+        return result
+
+    def health(self, payload=None):
+        snapshot = self.catalogue.get_with_lookups()[0]
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "catalogue_version": snapshot.version,
+            "cards": len(snapshot.df),
+            "batcher": dict(self.batcher.stats),
+            "response_cache_items": len(self._responses),
+        }
+
+    def handle(self, method, path, payload):
+        """Routes one request. Returns (status, response dict)."""
+        route = self.routes.get((method, path))
+        if route is None:
+            return 404, {"error": f"No route for {method} {path}"}
+        if method == "POST" and not isinstance(payload, dict):
+            return 400, {"error": "Body must be a JSON object"}
+        try:
+            with metrics.stage(f"service{path.replace('/', '_').replace('-', '_')}"):
+                return 200, route(payload)
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        except NotFound as e:
+            return 404, {"error": str(e)}
+
+# 5. HTTP SERVER
+# Stdlib only. Connections are handed to a fixed thread pool (not a thread per
+# connection), responses go out in one write with Nagle off, and HTTP/1.1
+# keep-alive lets a client reuse its connection for every request.
+class PooledHTTPServer(http.server.HTTPServer):
+    request_queue_size = 1024
+
+    def __init__(self, address, handler_class, service, workers=DEFAULT_WORKERS, reuse_port=False):
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+        self.reuse_port = reuse_port
+        super().__init__(address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            # Several processes accept on the same port; the kernel spreads connections
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+class ScoringHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    timeout = KEEP_ALIVE_SECONDS
+    server_version = "CredLens/1.0"
+
+    def _respond(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode()
+        head = (
+            f"HTTP/1.1 {status} {self.responses.get(status, ('',))[0]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'close' if self.close_connection else 'keep-alive'}\r\n\r\n"
+        ).encode()
+        self.wfile.write(head + data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._respond(200, metrics.REGISTRY.prometheus_text().encode(), "text/plain; version=0.0.4")
+            return
+        self._respond(*self.server.service.handle("GET", self.path, None))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._respond(413, {"error": "Request body too large"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._respond(400, {"error": "Body must be JSON"})
+            return
+        try:
+            self._respond(*self.server.service.handle("POST", self.path, payload))
+        except Exception as e:
+            print(f"Service Error: {e}")
+            self._respond(500, {"error": "Internal error"})
+
+    def log_message(self, format, *args):
+        pass # One line per request would cost more than the scoring itself
+
+def _serve_process(host, port, csv_path, workers, reuse_port, ready=None):
+    server = PooledHTTPServer((host, port), ScoringHandler, ScoringService(csv_path), workers, reuse_port)
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, csv_path="cards.csv", workers=DEFAULT_WORKERS, processes=1):
+    """Runs the service in the foreground (processes > 1 forks copies sharing the port)."""
+    if processes <= 1:
+        print(f"CredLens service on http://{host}:{port} ({workers} workers)")
+        _serve_process(host, port, csv_path, workers, reuse_port=False)
+        return
+    data_manager.compile_card_catalogue(csv_path) # Compile once; the children only memory-map it
+    children = [
+        multiprocessing.Process(target=_serve_process, args=(host, port, csv_path, workers, True), daemon=True)
+        for _ in range(processes)
+    ]
+    for child in children:
+        child.start()
+    print(f"CredLens service on http://{host}:{port} ({processes} processes x {workers} workers)")
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+
+# 6. LOAD GENERATOR
+# Client processes (so the generator is not limited by one GIL), each with a few
+# threads holding one keep-alive connection apiece, firing random profiles.
+def _sample_request(rng, endpoint, card_names):
+    spends = {c: float(v) for c, v in zip(logic.SPEND_CATEGORIES, rng.gamma(2.0, 2500.0, len(logic.SPEND_CATEGORIES)).round(-2))}
+    if endpoint == "rank":
+        return "/rank", {"salary": int(rng.choice([25000, 40000, 50000, 75000, 100000, 150000])), "spends": spends}
+    if endpoint == "score":
+        return "/score", {"card": card_names[rng.integers(len(card_names))], "spends": spends}
+    if endpoint == "break-even":
+        return "/break-even", {"card": card_names[rng.integers(len(card_names))], "spends": spends}
+    return "/verdict", {"card": card_names[rng.integers(len(card_names))], "spends": spends}
+
+def _load_worker(url, endpoints, card_names, seconds, threads, seed, out):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + seconds
+    lock = threading.Lock()
+    totals = {"latencies": [], "errors": 0}
+
+    def run(thread_seed):
+        rng = np.random.default_rng(thread_seed)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            path, body = _sample_request(rng, endpoints[rng.integers(len(endpoints))], card_names)
+            start = time.perf_counter()
+            try:
+                conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close() # Reconnects on the next request
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            totals["latencies"].extend(latencies)
+            totals["errors"] += errors
+
+    pool = [threading.Thread(target=run, args=(seed * 1000 + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    out.put((totals["latencies"], totals["errors"]))
+
+def loadgen(url=f"http://127.0.0.1:{DEFAULT_PORT}", seconds=10.0, connections=32, processes=4, endpoints=("rank",)):
+    """Hammers a running service and returns {"requests", "rps", "errors", "p50_ms", "p99_ms"}."""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    conn.request("GET", "/health")
+    health = json.loads(conn.getresponse().read())
+    conn.close()
+    # Card names for /score style endpoints come from the catalogue the service reads
+    card_names = list(data_manager.load_compiled_catalogue()['Card Name']) if set(endpoints) - {"rank"} else []
+
+    processes = max(1, min(processes, connections))
+    out = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_load_worker, args=(
+            url, list(endpoints), card_names, seconds, connections // processes + (i < connections % processes), i, out
+        ))
+        for i in range(processes)
+    ]
+    for w in workers:
+        w.start()
+    latencies, errors = [], 0
+    for _ in workers:
+        lat, err = out.get()
+        latencies.extend(lat)
+        errors += err
+    for w in workers:
+        w.join()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "service_pid": health["pid"],
+        "requests": len(latencies),
+        "rps": len(latencies) / seconds,
+        "errors": errors,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+# 7. CLI
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="run the scoring service")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_cmd.add_argument("--csv", default="cards.csv")
+    serve_cmd.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="request threads per process")
+    serve_cmd.add_argument("--processes", type=int, default=1, help="server processes sharing the port")
+
+    load_cmd = commands.add_parser("loadgen", help="measure a running service")
+    load_cmd.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    load_cmd.add_argument("--seconds", type=float, default=10.0)
+    load_cmd.add_argument("--connections", type=int, default=32)
+    load_cmd.add_argument("--processes", type=int, default=4, help="client processes")
+    load_cmd.add_argument("--endpoints", nargs="+", default=["rank"], choices=["rank", "score", "break-even", "verdict"])
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.csv, args.workers, args.processes)
+    else:
+        result = loadgen(args.url, args.seconds, args.connections, args.processes, args.endpoints)
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import csv
+import io
+import re
+from datetime import datetime
+
+# 1. MERCHANT CLASSIFIER
+# Keywords per spend bucket. They are compiled into ONE regex (a named group per
+# keyword), so each transaction is classified by a single search.
+# The keyword that appears first in the description wins; when several start at
+# the same place the longest one wins ("jiomart" over "jio", "uber eats" over
+# "uber"). No match = offline.
+CATEGORY_KEYWORDS = {
+    "upi": ["upi"],
+    "travel": ["makemytrip", "goibibo", "cleartrip", "yatra", "easemytrip", "irctc", "indigo", "air india",
+               "vistara", "spicejet", "akasa", "airlines", "airbnb", "oyo", "hotel", "uber", "ola cabs", "rapido", "redbus"],
+    "dining": ["swiggy", "zomato", "eatsure", "dineout", "restaurant", "cafe", "starbucks", "domino", "mcdonald",
+               "kfc", "pizza", "barbeque", "burger king", "uber eats"],
+    "utilities": ["electricity", "bescom", "bses", "mseb", "tata power", "adani", "water bill", "gas bill", "indane",
+                  "broadband", "recharge", "postpaid", "jio", "airtel", "vodafone", "bsnl", "dth", "tata play"],
+    "online": ["amazon", "flipkart", "myntra", "ajio", "nykaa", "meesho", "bigbasket", "blinkit", "zepto",
+               "jiomart", "tatacliq", "netflix", "spotify", "hotstar", "google play", "apple.com"],
+}
+SPEND_KEYS = ("online", "travel", "dining", "utilities", "upi", "offline")
+
+def compile_classifier(category_keywords=CATEGORY_KEYWORDS):
+    """Builds the single multi-pattern matcher used by classify()."""
+    keywords = [(word, category) for category, words in category_keywords.items() for word in words]
+    # re takes the first alternative that matches at a position, so list longer keywords first
+    keywords.sort(key=lambda item: len(item[0]), reverse=True)
+    groups = [f"(?P<{category}__{i}>{re.escape(word)})" for i, (word, category) in enumerate(keywords)]
+    return re.compile(r"\b(?:" + "|".join(groups) + ")", re.IGNORECASE)
+
+_CLASSIFIER = compile_classifier()
+
+def classify(description, classifier=_CLASSIFIER):
+    """Spend bucket for one transaction description."""
+    match = classifier.search(description)
+    return match.lastgroup.rsplit("__", 1)[0] if match else "offline"
+
+# 2. STREAMING PARSER
+# Bank exports differ in column names, so headers are matched against aliases.
+HEADER_ALIASES = {
+    "date": ("date", "transaction date", "txn date", "posting date", "value date"),
+    "description": ("description", "narration", "details", "transaction details", "particulars", "merchant", "remarks"),
+    "amount": ("amount", "amount (inr)", "amount(inr)", "debit", "debit amount", "withdrawal", "withdrawal amt."),
+    "type": ("type", "dr/cr", "cr/dr", "debit/credit"),
+}
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y", "%d %b %Y", "%d-%b-%Y", "%d %b %y", "%d-%b-%y")
+
+def _find_columns(header):
+    names = [h.strip().lower() for h in header]
+    columns = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for i, name in enumerate(names):
+            if name in aliases:
+                columns[field] = i
+                break
+    missing = {"date", "description", "amount"} - set(columns)
+    if missing:
+        raise ValueError(f"Statement is missing columns: {', '.join(sorted(missing))}")
+    return columns
+
+def _parse_amount(text):
+    """'1,234.50', '₹ 1,234.50 Dr', '(250.00)' -> float. Blank -> 0."""
+    text = text.replace(",", "").replace("₹", "").replace("INR", "").strip()
+    if not text:
+        return 0.0
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()")
+    upper = text.upper()
+    if upper.endswith(("CR", "DR")):
+        text = text[:-2].strip()
+    value = float(text)
+    return -value if negative else value
+
+_TRAILING_TIME = re.compile(r"[\sT]+\d{1,2}:\d{2}(:\d{2})?(\s*[AP]M)?$", re.IGNORECASE)
+
+class _DateParser:
+    """
+    Remembers the last format that worked and every date string already seen
+    (statements repeat the same dates many times; strptime is the slow part).
+    """
+
+    def __init__(self):
+        self.last_format = DATE_FORMATS[0]
+        self._seen = {}
+
+    def month(self, text):
+        cached = self._seen.get(text)
+        if cached is not None:
+            return cached
+        clean = _TRAILING_TIME.sub("", text.strip())
+        for fmt in (self.last_format,) + DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(clean, fmt)
+            except ValueError:
+                continue
+            self.last_format = fmt
+            if len(self._seen) < 50000: # Timestamps with times are all unique; don't grow forever
+                self._seen[text] = (parsed.year, parsed.month)
+            return (parsed.year, parsed.month)
+        raise ValueError(f"Unrecognised date: {text}")
+
+def iter_transactions(lines):
+    """
+    Yields (year_month, category, amount) for every spend in a statement CSV.
+    lines can be any iterable of text lines (an open file, a text stream), so
+    the statement is never loaded fully into memory. Credits (payments,
+    refunds, cashback) and rows that cannot be parsed are skipped.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = _find_columns(header)
+    dates = _DateParser()
+
+    for row in reader:
+        if len(row) <= max(columns.values()):
+            continue
+        amount_text = row[columns["amount"]].strip()
+        if amount_text.upper().endswith("CR"):
+            continue # "1,000.00 Cr" style credit
+        if "type" in columns and row[columns["type"]].strip().upper().startswith("C"):
+            continue # Separate Dr/Cr column
+        try:
+            amount = _parse_amount(amount_text)
+            if amount <= 0:
+                continue # Blank debit (credit row in a debit/credit layout) or a refund
+            year_month = dates.month(row[columns["date"]])
+        except ValueError:
+            continue
+        yield year_month, classify(row[columns["description"]]), amount
+
+# 3. AGGREGATION (Single pass, memory grows with months, not rows)
+def summarize_statement(lines):
+    """
+    Monthly category totals: {"months": {(year, month): {category: total}}, "transactions": n}.
+    """
+    months = {}
+    count = 0
+    for year_month, category, amount in iter_transactions(lines):
+        totals = months.get(year_month)
+        if totals is None:
+            totals = months[year_month] = dict.fromkeys(SPEND_KEYS, 0.0)
+        totals[category] += amount
+        count += 1
+    return {"months": months, "transactions": count}
+
+def monthly_average_spends(summary):
+    """
+    Turns a summary into the same spends dict render_sidebar returns
+    (monthly averages, rounded to the rupee, plus 'total').
+    """
+    months = summary["months"]
+    spends = dict.fromkeys(SPEND_KEYS, 0)
+    if months:
+        for category in SPEND_KEYS:
+            spends[category] = int(round(sum(m[category] for m in months.values()) / len(months)))
+    spends["total"] = sum(spends[k] for k in SPEND_KEYS)
+    return spends
+
+def spends_from_upload(uploaded_file, encoding="utf-8-sig"):
+    """Streams a Streamlit UploadedFile (or any binary file) into a spends dict + summary."""
+    uploaded_file.seek(0)
+    text = io.TextIOWrapper(uploaded_file, encoding=encoding, errors="replace", newline="")
+    try:
+        summary = summarize_statement(text)
+    finally:
+        text.detach() # Leave the upload open for Streamlit
+    return monthly_average_spends(summary), summary
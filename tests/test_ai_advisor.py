@@ -0,0 +1,62 @@
+import sqlite3
+import time
+
+import pytest
+
+from ai_advisor import CircuitOpenError, FakeModel, ManagedModel, VerdictCache
+
+def _open_circuit(model):
+    with pytest.raises(RuntimeError):
+        list(model.stream("p"))
+    assert model.circuit_open
+
+def test_half_open_admits_exactly_one_trial():
+    model = ManagedModel(FakeModel(first_token_delay=0, chunk_delay=0, error=RuntimeError("down")),
+                         failure_threshold=1, cooldown=0.05)
+    _open_circuit(model)
+    with pytest.raises(CircuitOpenError):
+        next(model.stream("p"))
+    time.sleep(0.06)
+
+    model.model.error = None
+    trial = model.stream("p")
+    next(trial) # The trial is now in flight
+    for _ in range(3):
+        with pytest.raises(CircuitOpenError):
+            next(model.stream("p"))
+    list(trial)
+    assert not model.circuit_open
+    assert "".join(model.stream("p")) == model.model.text
+    assert model.stats["short_circuited"] == 4
+
+def test_failed_trial_reopens_the_circuit():
+    model = ManagedModel(FakeModel(first_token_delay=0, error=RuntimeError("down")),
+                         failure_threshold=3, cooldown=0.05)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            list(model.stream("p"))
+    assert model.circuit_open
+    time.sleep(0.06)
+    with pytest.raises(RuntimeError):
+        list(model.stream("p")) # One failed trial is enough, not another three
+    assert model.circuit_open
+    with pytest.raises(CircuitOpenError):
+        next(model.stream("p"))
+
+def test_verdict_cache_closes_its_connections(tmp_path, monkeypatch):
+    opened = []
+    real_connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        opened.append(real_connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    cache = VerdictCache(path=str(tmp_path / "verdicts.sqlite"), max_entries=1)
+    cache.set("a", "first")
+    cache.set("b", "second") # Evicts "a" from memory, so the next get reads the disk
+    assert cache.get("a") == "first"
+    assert len(opened) == 4
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError): # Operating on a closed database
+            conn.execute("SELECT 1")
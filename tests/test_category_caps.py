@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import logic
+
+@pytest.fixture(scope="module")
+def cards():
+    return pd.read_csv("cards.csv")
+
+def _airtel(cards):
+    return int(np.flatnonzero(cards["Card Name"] == "Airtel Axis Bank")[0])
+
+# ₹10k/month on dining at 10% is ₹1,000/month, but Airtel Axis pays at most ₹250 of it
+SPENDS = {"online": 0, "travel": 0, "dining": 10000, "utilities": 0, "upi": 0, "offline": 0, "total": 10000}
+EXPECTED = 250 * 12 - 500 # the old flat Monthly Cap (₹500) gave 500 * 12 - 500 = 5500
+
+def test_category_cap_applies_in_every_engine(cards):
+    i = _airtel(cards)
+    card_arrays = logic.build_card_arrays(cards)
+    assert logic.calculate_card_yield(cards.iloc[i], SPENDS) == EXPECTED
+    assert logic.score_card_arrays(card_arrays, SPENDS)[i] == EXPECTED
+    assert logic.IncrementalScorer(card_arrays, SPENDS).scores[i] == EXPECTED
+    profiles = logic.score_profiles(card_arrays, logic.spend_matrix([SPENDS]), [100000])
+    assert profiles["net_savings"][0, i] == EXPECTED
+    assert logic.score_card_arrays_monthly(card_arrays, logic.spend_schedule(SPENDS))[i] == EXPECTED
+
+def test_flat_engines_match_scalar_and_monthly(cards):
+    rng = np.random.default_rng(0)
+    card_arrays = logic.build_card_arrays(cards)
+    for _ in range(50):
+        spends = dict(zip(logic.SPEND_CATEGORIES, rng.choice([0, 500, 2500, 10000, 40000], len(logic.SPEND_CATEGORIES)).tolist()))
+        scalar = [logic.calculate_card_yield(row, spends) for _, row in cards.iterrows()]
+        np.testing.assert_array_equal(logic.score_card_arrays(card_arrays, spends), scalar)
+        np.testing.assert_allclose(logic.score_card_arrays_monthly(card_arrays, logic.spend_schedule(spends)), scalar)
+
+def test_seasonal_month_over_the_cap_loses_the_excess(cards):
+    i = _airtel(cards)
+    card_arrays = logic.build_card_arrays(cards)
+    spends = {**SPENDS, "dining": 2000} # ₹200/month reward, under the ₹250 cap
+    festive = np.ones(12)
+    festive[9] = 6 # one ₹12k month: ₹1,200 earned, ₹250 paid
+    net = logic.score_card_arrays_monthly(card_arrays, logic.spend_schedule(spends, seasonality=festive))[i]
+    assert net == pytest.approx(11 * 200 + 250 - 500)
@@ -0,0 +1,82 @@
+import streamlit as st
+from streamlit.runtime.secrets import AttrDict
+
+import data_manager
+from lead_writer import LeadWriter
+
+class RecordingSink:
+    rows = []
+
+    def __init__(self, service_account_info):
+        self.service_account_info = service_account_info
+
+    def write_rows(self, rows):
+        RecordingSink.rows.extend(rows)
+
+def test_save_lead_with_streamlit_secrets(monkeypatch, tmp_path):
+    # st.secrets hands out AttrDicts, which st.cache_resource cannot hash
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(st, "secrets", AttrDict({"gcp_service_account": {"client_email": "bot@example.com", "private_key": "k"}}))
+    monkeypatch.setattr(data_manager, "SheetsSink", RecordingSink)
+    data_manager.get_lead_writer.clear()
+    spends = {"online": 1000, "travel": 0, "offline": 500}
+    try:
+        data_manager.save_lead_to_sheets(50000, spends, "Axis Ace", 1200)
+        data_manager.save_lead_to_sheets(60000, spends, "Axis Ace", 1300)
+        writer = data_manager.get_lead_writer(data_manager.freeze_secrets(st.secrets["gcp_service_account"]))
+        assert writer.flush(timeout=5)
+        assert writer.sink.service_account_info["client_email"] == "bot@example.com"
+        assert [row[-1] for row in RecordingSink.rows] == [1200, 1300]
+    finally:
+        data_manager.get_lead_writer.clear()
+
+class ListSink:
+    def __init__(self, fail=False):
+        self.rows = []
+        self.fail = fail
+
+    def write_rows(self, rows):
+        if self.fail:
+            raise RuntimeError("sink down")
+        self.rows.extend(rows)
+
+def test_corrupt_spool_line_is_quarantined(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    # The last line was cut short by a crash mid-append
+    spool.write_text('["a", 1]\n["b", 2]\n["c", ')
+    sink = ListSink()
+    writer = LeadWriter(sink, spool_path=str(spool), flush_interval=0.05)
+    try:
+        writer.submit(["d", 4])
+        assert writer.flush(timeout=5)
+        assert sorted(sink.rows) == [["a", 1], ["b", 2], ["d", 4]]
+        assert (tmp_path / "spool.jsonl.bad").read_text() == '["c", \n'
+        assert writer._thread.is_alive()
+    finally:
+        writer.close()
+
+def test_worker_survives_spool_errors(tmp_path):
+    # Spooling fails too (its folder does not exist): the row is lost, the worker is not
+    sink = ListSink(fail=True)
+    writer = LeadWriter(sink, spool_path=str(tmp_path / "missing" / "spool.jsonl"), flush_interval=0.05)
+    try:
+        writer.submit(["a", 1])
+        assert writer.flush(timeout=5)
+        assert writer.stats["errors"] == 1
+        sink.fail = False
+        writer.submit(["b", 2])
+        assert writer.flush(timeout=5)
+        assert sink.rows == [["b", 2]]
+    finally:
+        writer.close()
+
+def test_new_rows_start_on_their_own_line(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    spool.write_text('["a", ')
+    writer = LeadWriter(ListSink(fail=True), spool_path=str(spool), flush_interval=0.05)
+    try:
+        writer.submit(["b", 2])
+        assert writer.flush(timeout=5)
+        assert spool.read_text() == '["a", \n["b", 2]\n'
+    finally:
+        writer.close()
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import service
+
+@pytest.fixture(scope="module")
+def scoring(tmp_path_factory):
+    # The compiled catalogue goes to a scratch folder, not the repo
+    cwd = os.getcwd()
+    csv_path = os.path.join(cwd, "cards.csv")
+    os.chdir(tmp_path_factory.mktemp("service"))
+    try:
+        yield service.ScoringService(csv_path)
+    finally:
+        os.chdir(cwd)
+
+SPENDS = {"online": 10000, "dining": 3000}
+
+@pytest.mark.parametrize("body", [[], [{"salary": 50000}], "rank", 3, None])
+def test_non_object_body_is_a_bad_request(scoring, body):
+    status, response = scoring.handle("POST", "/rank", body)
+    assert status == 400
+    assert response == {"error": "Body must be a JSON object"}
+
+@pytest.mark.parametrize("value", ["false", "true", 0, 1, None])
+def test_wants_lounge_must_be_a_json_boolean(scoring, value):
+    status, response = scoring.handle("POST", "/rank", {"salary": 50000, "spends": SPENDS, "wants_lounge": value})
+    assert status == 400
+    assert "wants_lounge" in response["error"]
+
+def test_wants_lounge_boolean_is_accepted(scoring):
+    for value in (True, False):
+        status, response = scoring.handle("POST", "/rank", {"salary": 50000, "spends": SPENDS, "wants_lounge": value})
+        assert status == 200
+        assert response["cards"]
+
+def test_sweep_flag(scoring):
+    body = {"card": "Axis Ace", "spends": SPENDS}
+    assert "sweep" not in scoring.handle("POST", "/break-even", {**body, "sweep": False})[1]
+    assert "sweep" in scoring.handle("POST", "/break-even", {**body, "sweep": True})[1]
+    assert scoring.handle("POST", "/break-even", {**body, "sweep": "false"})[0] == 400
@@ -0,0 +1,16 @@
+import pytest
+
+from statement_parser import classify
+
+@pytest.mark.parametrize("description, category", [
+    ("JIOMART ORDER 123", "online"),
+    ("JIO PREPAID RECHARGE", "utilities"),
+    ("UBER EATS BANGALORE", "dining"),
+    ("UBER TRIP 4411", "travel"),
+    ("SWIGGY*ORDER via UPI", "dining"),
+    ("UPI/SWIGGY/123", "upi"),
+    ("DOMINOS PIZZA", "dining"),
+    ("LOCAL KIRANA STORE", "offline"),
+])
+def test_classify(description, category):
+    assert classify(description) == category
@@ -1,7 +1,9 @@
 import streamlit as st
-import altair as alt
+import numpy as np
 import pandas as pd
-from logic import format_inr # We reuse the formatter
+from logic import format_inr, format_inr_array, BREAK_EVEN_NEVER, TRIPLE_POOL_MAX # We reuse the formatter
+import statement_parser
+import data_manager
 
 # In ui.py
 
@@ -106,38 +108,36 @@ def render_custom_css():
 # 2. HELPER: BRAND COLORS
 
 def get_brand_color(card_name):
-    # Dictionary mapping brand keywords to Hex Codes
-    colors = {
-        # The Big Players
-        "SBI": "#1C4FA1",       # Navy Blue
-        "HDFC": "#004C8F",      # Dark Blue
-        "Axis": "#97144D",      # Burgundy (Axis Official)
-        "ICICI": "#F58220",     # Orange
-        "Amex": "#006FCF",      # Bright Blue
-        "American": "#006FCF",  
-        
-        # The New Specialists (Added)
-        "Airtel": "#E40000",    # Airtel Red
-        "Swiggy": "#FC8019",    # Swiggy Orange
-        "Tata": "#2B2E34",      # Tata Black/Grey
-        "Amazon": "#FF9900",    # Amazon Yellow/Orange
-        "HSBC": "#DB0011",      # HSBC Red
-        "Yes": "#00539C",       # Yes Bank Blue
-        "AU": "#682C91",        # AU Bank Purple
-        "IDFC": "#9C1D27",      # IDFC Red
-        "OneCard": "#1A1A1A",   # Metal Black
-        "Standard": "#007D3E",  # SC Green (Official is Green/Blue)
-    }
-    
-    # Search for the keyword in the card name
-    for brand, color in colors.items():
-        if brand.lower() in str(card_name).lower():
-            return color
-            
-    # Default Color (if no brand matches)
-    return "#555555" # Changed to Grey (Neutral) instead of Red (Danger)
+    """Brand colour for any card name (catalogue rows already carry it as 'Brand Color')."""
+    return data_manager.brand_color(card_name)
 
 # 3. SIDEBAR INPUTS
+def render_statement_import():
+    """Optional CSV statement upload that pre-fills the monthly spend inputs."""
+    with st.expander("📄 Import from statement (CSV)"):
+        statement = st.file_uploader("Card or bank statement", type=["csv"], key="statement_file")
+        file_id = getattr(statement, "file_id", None) or getattr(statement, "name", None)
+
+        if statement is None:
+            st.session_state.pop("statement_id", None)
+        elif st.session_state.get("statement_id") != file_id:
+            # New file: parse it once, streaming, and push the averages into the inputs
+            try:
+                derived, summary = statement_parser.spends_from_upload(statement)
+            except ValueError as e:
+                st.error(f"Could not read this statement: {e}")
+                return
+            for key in ("online", "travel", "offline", "dining"):
+                st.session_state[key] = min(derived[key], 100000) # Matches the inputs' max_value
+            for key in ("utilities", "upi"):
+                st.session_state[key] = derived[key]
+            st.session_state["statement_id"] = file_id
+            st.session_state["statement_summary"] = (summary["transactions"], len(summary["months"]))
+
+        if statement is not None and "statement_summary" in st.session_state:
+            count, months = st.session_state["statement_summary"]
+            st.caption(f"Averaged {count} spends over {months} month(s). You can still edit them below.")
+
 def render_sidebar(card_list):
     """Renders the sidebar and returns a dictionary of user inputs."""
     with st.sidebar:
@@ -146,12 +146,15 @@ def render_sidebar(card_list):
         st.divider()
         
         st.subheader("💸 Monthly Spends")
+        # NEW: Fill the spends below from a statement (must run before the inputs are drawn)
+        render_statement_import()
         c1, c2 = st.columns(2)
         with c1:
             online = st.number_input("Online (₹)", min_value=0, max_value=100000, step=1000, key="online", format="%d")
             travel = st.number_input("Travel (₹)", min_value=0, max_value=100000, step=1000, key="travel", format="%d")
         with c2:
             offline = st.number_input("Offline (₹)", min_value=0, max_value=100000, step=1000, key="offline", format="%d")
+            dining = st.number_input("Dining (₹)", min_value=0, max_value=100000, step=1000, key="dining", format="%d")
 
         
         # NEW: Advanced Section for Specialist Cards
@@ -159,7 +162,7 @@ def render_sidebar(card_list):
             utilities = st.number_input("⚡ Utilities (Bills, Recharge)", min_value=0, key="utilities", step=500)
             upi = st.number_input("📱 UPI / Scan & Pay", min_value=0, key="upi", step=500)
         
-        total = online + travel + offline + utilities + upi
+        total = online + travel + offline + utilities + upi + dining
         st.info(f"Total Monthly Spend: **{format_inr(total)}**")
         
         
@@ -190,7 +193,7 @@ def render_sidebar(card_list):
         
     return {
         "salary": salary,
-        "spends": {"online": online, "travel": travel, "offline": offline, "total": total, "utilities": utilities, "upi": upi},
+        "spends": {"online": online, "travel": travel, "offline": offline, "total": total, "utilities": utilities, "upi": upi, "dining": dining},
         "wants_lounge": wants_lounge,
         "enable_ai": enable_ai,
         "ask_ai_clicked": ask_ai_clicked,
@@ -198,10 +201,19 @@ def render_sidebar(card_list):
     }
 
 # 4. RESULTS DISPLAY (The Heavy Lifter)
-def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spends, verdict, comparison_data = None):
-    """Renders the entire results section (Top Card + Chart + Table)."""
+def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spends, verdict, comparison_data = None, ai_pending = False, full_table_fn = None, portfolio_fn = None, sweep_fn = None):
+    """
+    Renders the entire results section (Top Card + Chart + Table).
+    valid_cards_df only needs the top cards (best first); full_table_fn() builds
+    the complete ranked table and is only called when the comparison is opened.
+    portfolio_fn(triples) returns the best card combinations (see app.py) and is
+    only called when the combos section is opened.
+    sweep_fn() returns break-even curves for the top cards (same lazy pattern).
+    If ai_pending, returns an empty advisor slot for render_ai_stream to fill.
+    """
     
     st.markdown("---")
+    ai_slot = None
     
     # A. Layout: Left (Details) | Right (Stats & Image)
     # Using the same ratio as before
@@ -213,7 +225,7 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
         with col_c:
             # Badge Logic
             status = best_card.get("Status", "Stable")
-            s_class = f"status-{status.lower()}" if status.lower() else "stable"
+            s_class = best_card.get("Status Class", "status-stable") # Precomputed per catalogue version
             
             st.markdown(f"## 🏆 {best_card['Card Name']} <span class='status-badge {s_class}'>{status}</span>", unsafe_allow_html=True)
             annual_net_saving = best_card['Net Savings']
@@ -235,11 +247,8 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
                 st.progress(100)
             else:
                 # CASE 2: Normal Card (Do the math)
-                # Calculate percent recovered (capped at 100% for the bar)
-                percent_recovered = min(best_card['Net Savings'] + best_card['Fee'], best_card['Fee']) / best_card['Fee']
-                
-                # Guardrail: Ensure it doesn't crash if something goes wrong, though Fee != 0 covers it
-                if percent_recovered < 0: percent_recovered = 0
+                # Percent recovered (0..1, from the batched break-even engine)
+                percent_recovered = break_even_stats["pct_recovered"]
                 
                 bar_color = "green" if percent_recovered >= 1.0 else "red"
                 st.progress(float(percent_recovered))
@@ -261,6 +270,10 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
             if ai_verdict:
                 st.markdown("###")
                 st.info(f"🤖 **Advisor:** {ai_verdict}")
+            elif ai_pending:
+                st.markdown("###")
+                ai_slot = st.empty()
+                ai_slot.info("🤖 **Advisor:** _thinking..._")
 
     # --- RIGHT COLUMNS: Stats & Image ---
     with col_stats:
@@ -346,14 +359,15 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
             
     with col_action:
         st.markdown('<div style="padding-top: 15px;"></div>', unsafe_allow_html=True)
-        img_url = best_card.get('Image_URL')
-        if pd.notna(img_url):
-            st.image(img_url, use_container_width=True)
+        # Served as bytes from the local thumbnail cache, never hot-linked from the bank's site
+        img_bytes = data_manager.get_card_image(best_card.get('Image_URL'))
+        if img_bytes is not None:
+            st.image(img_bytes, use_container_width=True)
         
         # Apply Button
         link = best_card.get('Apply_Link')
         if pd.notna(link):
-            color = get_brand_color(best_card['Card Name'])
+            color = best_card.get('Brand Color') or get_brand_color(best_card['Card Name'])
             
             # We inject the style and class here
             st.markdown(f"""
@@ -369,7 +383,7 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
         st.markdown("###")
         st.markdown("They rate on features. We rate on **Math**.")
         # 4. CARD: Link 
-        search_query = best_card['Card Name'].replace(' ', '+')
+        search_query = best_card.get('Search Slug') or best_card['Card Name'].replace(' ', '+')
         st.markdown(f"For detailed reviews, [click here](https://www.google.com/search?q={search_query}+reviews).")
 
     # 5. RESTORED: The Math Expander 
@@ -408,6 +422,7 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
 
     # 6. FIXED: Chart Height (Fixing Item #5)
     st.subheader("📊 Profitability Comparison")
+    import altair as alt # Lazy: only needed once there are results to chart
     chart_data = valid_cards_df.head(5).copy()
     c = alt.Chart(chart_data).mark_bar(cornerRadiusTopRight=10, cornerRadiusBottomRight=10).encode(
         x=alt.X('Net Savings', title='Net Annual Value (₹)'),
@@ -416,36 +431,118 @@ def render_results(best_card, break_even_stats, ai_verdict, valid_cards_df, spen
     ).properties(height=350) # <--- Increased height here
     st.altair_chart(c, use_container_width=True)
     
-    with st.expander("🔍 Detailed Comparison"):
+    # on_change="rerun" makes the expander lazy: its body only runs while open
+    details = st.expander("🔍 Detailed Comparison", key="detailed_comparison", on_change="rerun")
+    if details.open:
+        with details:
+            table_df = full_table_fn() if full_table_fn else valid_cards_df
             # Define the columns we WANT to show
-        display_cols = [
-            "Card Name", "Status", "Net Savings", "Fee", 
-            "Reward Type", "Min Income", "Warning_Text"
-        ]
+            display_cols = [
+                "Card Name", "Status", "Net Savings", "Fee", "Break-Even Spend", "Fee Recovered",
+                "Reward Type", "Min Income", "Warning_Text"
+            ]
         
-        # Filter the dataframe to only show these columns (if they exist)
-        # We use list intersection to avoid errors if a column is missing
-        final_cols = [c for c in display_cols if c in valid_cards_df.columns]
+            # Filter the dataframe to only show these columns (if they exist)
+            # We use list intersection to avoid errors if a column is missing
+            final_cols = [c for c in display_cols if c in table_df.columns]
         
-        display_df = valid_cards_df[final_cols].copy()
+            display_df = table_df[final_cols].copy()
         
-        # Format the numbers for display
-        if "Net Savings" in display_df.columns:
-            display_df["Net Savings"] = display_df["Net Savings"].apply(format_inr)
+            # Format the numbers for display (whole columns at once)
+            if "Net Savings" in display_df.columns:
+                display_df["Net Savings"] = format_inr_array(display_df["Net Savings"])
+            if "Break-Even Spend" in table_df.columns:
+                break_even = table_df["Break-Even Spend"].to_numpy()
+                display_df["Break-Even Spend"] = np.where(break_even >= BREAK_EVEN_NEVER, "Never", format_inr_array(break_even))
+                display_df["Fee Recovered"] = (table_df["Fee Recovered"] * 100).round().astype(int).astype(str) + "%"
         
-        st.dataframe(
-            display_df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Status": st.column_config.TextColumn(
-                    "Status",
-                    help="Hot, Stable, or Devalued",
-                    width="small"
-                ),
-                "Warning_Text": st.column_config.TextColumn(
-                    "Warnings",
-                    width="medium"
-                )
-            }
-        )
\ No newline at end of file
+            st.dataframe(
+                display_df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Status": st.column_config.TextColumn(
+                        "Status",
+                        help="Hot, Stable, or Devalued",
+                        width="small"
+                    ),
+                    "Warning_Text": st.column_config.TextColumn(
+                        "Warnings",
+                        width="medium"
+                    ),
+                    "Break-Even Spend": st.column_config.TextColumn(
+                        "Break-Even Spend",
+                        help="Monthly spend at which the rewards pay for the annual fee"
+                    )
+                }
+            )
+
+    if sweep_fn is not None:
+        render_break_even_curves(sweep_fn)
+
+    if portfolio_fn is not None:
+        render_portfolios(portfolio_fn, spends)
+
+    return ai_slot
+
+def render_break_even_curves(sweep_fn):
+    """Lazy chart of Net Savings vs monthly spend for the top cards (crossing zero = break-even)."""
+    curves_section = st.expander("📈 Break-Even Curves", key="break_even_curves", on_change="rerun")
+    if not curves_section.open:
+        return
+    with curves_section:
+        import altair as alt
+        curves = sweep_fn()
+        lines = alt.Chart(curves).mark_line(point=True).encode(
+            x=alt.X('Monthly Spend', title='Monthly Spend (₹)'),
+            y=alt.Y('Net Savings', title='Net Annual Value (₹)'),
+            color=alt.Color('Card Name', legend=alt.Legend(orient='bottom', columns=2)),
+        )
+        zero = alt.Chart(pd.DataFrame({"y": [0]})).mark_rule(strokeDash=[4, 4], color="#999999").encode(y='y')
+        st.altair_chart(lines + zero, use_container_width=True)
+        st.caption("Your current spend is the 1× point; the curves scale every category together, caps included.")
+
+CATEGORY_LABELS = {"online": "Online", "travel": "Travel", "dining": "Dining", "utilities": "Utilities", "upi": "UPI", "offline": "Offline"}
+
+def render_portfolios(portfolio_fn, spends):
+    """Lazy 'Best Card Combos' section: which 2 (or 3) cards to hold and what to use each one for."""
+    combos_section = st.expander("🃏 Best Card Combos", key="card_combos", on_change="rerun")
+    if not combos_section.open:
+        return
+    with combos_section:
+        triples = st.checkbox("Also try 3-card combos", key="combo_triples")
+        portfolios = portfolio_fn(triples)
+        combos = portfolios["pairs"] + portfolios["triples"]
+        # The 3-card search is capped at the best TRIPLE_POOL_MAX single cards; say so when that cut it short
+        approximate = triples and not portfolios["stats"]["triples_exact"]
+        approximate_note = f"3-card combos were only searched among your {TRIPLE_POOL_MAX} best single cards, so a better trio may exist."
+        if not combos:
+            st.caption("A second card doesn't help with these spends.")
+            if approximate:
+                st.caption(approximate_note)
+            return
+
+        single = portfolios["single"]
+        for combo in sorted(combos, key=lambda c: -c["net_savings"]):
+            extra = combo["net_savings"] - single["net_savings"]
+            st.markdown(f"**{' + '.join(combo['cards'])}**: {format_inr(combo['net_savings'])}/yr after {format_inr(combo['fee'])} in fees"
+                        + (f" ({format_inr(extra)} more than {single['card']} alone)" if extra > 0 else ""))
+            routes = [f"{CATEGORY_LABELS[cat]} → {card}" for cat, card in combo["routing"].items() if spends.get(cat, 0) > 0]
+            st.caption(" · ".join(routes))
+        if approximate:
+            st.caption(approximate_note)
+
+# 5. AI ADVISOR (Streams into the slot left by render_results)
+def render_ai_stream(slot, job):
+    """Updates the advisor box as text arrives; gives up at the job's deadline."""
+    text = ""
+    for text in job.stream():
+        slot.info(f"🤖 **Advisor:** {text}")
+
+    if not job.done:
+        if text:
+            slot.info(f"🤖 **Advisor:** {text}…")
+        else:
+            slot.caption("🤖 The advisor is taking too long. Ask again in a moment.")
+    elif not job.text:
+        slot.empty() # Failed quietly, same as before